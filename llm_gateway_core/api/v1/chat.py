@@ -1,8 +1,7 @@
 import logging
 import json5
-import copy
+import orjson
 import asyncio
-import os
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import StreamingResponse
 
@@ -10,11 +9,16 @@ from fastapi.responses import StreamingResponse
 from ...config.loader import ConfigLoader
 from ...config.settings import settings
 from ...db.model_rotation_db import ModelRotationDB
-from ...services.request_handler import make_llm_request
+from ...services.provider_breaker import ProviderBreaker
+from ...services.request_handler import make_llm_request_stream, make_llm_request_oneshot
 
 # model_rotation_db can remain as a module-level instance
 model_rotation_db = ModelRotationDB() # Instantiate DB access
 
+# Skips providers that recently kept failing instead of paying their RTT or
+# timeout on every request in the fallback chain.
+provider_breaker = ProviderBreaker()
+
 router = APIRouter()
 
 @router.post("/completions")
@@ -25,36 +29,48 @@ async def chat_completions(request: Request):
         # It's good practice to log this, as it indicates a setup issue in main.py or app lifecycle
         raise HTTPException(status_code=500, detail="Internal server error: Core configuration not available.")
     
-    providers_config = config_loader_instance.providers_config
-    fallback_rules = config_loader_instance.fallback_rules
     try:
         request_body_bytes = await request.body()
-        request_body_json = json5.loads(request_body_bytes.decode('utf-8'))
+        try:
+            # orjson takes the raw bytes directly (no decode pass) and is
+            # several times faster than json5 on large messages arrays
+            request_body_json = orjson.loads(request_body_bytes)
+        except orjson.JSONDecodeError:
+            # Keep the lenient parser as a fallback for non-strict clients
+            request_body_json = json5.loads(request_body_bytes.decode('utf-8'))
         
-        payload_to_log = copy.deepcopy(request_body_json)
-        payload_to_log["messages"] = "<REMOVED>" # Remove messages from payload for logging
-        logging.debug(f"/v1/chat/completions: Request for model \'{payload_to_log['model']}\'. Payload: {payload_to_log}") # Log the payload without messages
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            # Shallow copy with messages masked; deepcopy walked the whole
+            # conversation history just to build this log line
+            payload_to_log = {**request_body_json, "messages": "<REMOVED>"}
+            logging.debug(f"/v1/chat/completions: Request for model \'{payload_to_log['model']}\'. Payload: {payload_to_log}") # Log the payload without messages
     except Exception as e:
         logging.error(f"Error reading request body: {str(e)}", exc_info=True)
         raise HTTPException(status_code=400, detail=f"Error reading request body: {str(e)}")
 
     requested_model = request_body_json.get("model")
     is_streaming = request_body_json.get("stream", False)
+    # Pick the specialized request function once; neither variant re-checks
+    # the mode or carries the other's state.
+    request_fn = make_llm_request_stream if is_streaming else make_llm_request_oneshot
 
     if not requested_model:
         raise HTTPException(status_code=400, detail="Missing 'model' in request body")
 
-    # 1. Find Routing Rule or Use Fallback
-    model_config = fallback_rules.get(requested_model)
-    if not model_config:
+    # 1. Find Routing Rule or Use Fallback. Routes are pre-compiled at config
+    # load time (URLs joined, API keys resolved, headers built), so the hot
+    # path below is attribute access only.
+    compiled_route = config_loader_instance.compiled_routes.get(requested_model)
+    if not compiled_route:
         logging.warning(f"No specific fallback sequence found for model '{requested_model}'. Using '{settings.fallback_provider}' fallback provider.")
 
-        model_fallbacks_sequence = [{"provider": settings.fallback_provider, "model": requested_model}] # Use the fallback provider as a single-item sequence
+        default_step = config_loader_instance.compile_default_step(settings.fallback_provider, requested_model)
+        model_fallbacks_sequence = [default_step] if default_step else []
         rotate_models = False
         logging.info(f"Using fallback provider: {settings.fallback_provider}")
     else:
-        model_fallbacks_sequence = model_config["fallback_models"]
-        rotate_models = model_config["rotate_models"]
+        model_fallbacks_sequence = compiled_route.steps
+        rotate_models = compiled_route.rotate
         logging.info(f"Found routing rule for model '{requested_model}'. Provider sequence length: {len(model_fallbacks_sequence)}")
         logging.info(f"Model rotation is {'enabled' if rotate_models else 'disabled'} for model '{requested_model}'")
 
@@ -80,53 +96,40 @@ async def chat_completions(request: Request):
 
     # 2. Iterate Through Providers and Attempt Requests
     last_error_detail = "No providers were attempted."
-    for model_fallback_rule in model_fallbacks_sequence: 
-
-        provider_name = model_fallback_rule.get("provider")
-        provider_model = model_fallback_rule.get("model")
-        retry_delay = model_fallback_rule.get("retry_delay")
-        retry_count = model_fallback_rule.get("retry_count") or 0
-        subproviders_ordering = model_fallback_rule.get("providers_order") # openrouter support for subproviders ordering
-
-        logging.info(f"Attempting  model '{requested_model}' in provider: {provider_name} for subproviders ordering: {subproviders_ordering}")
+    for step in model_fallbacks_sequence: 
 
-        provider_config = providers_config.get(provider_name)
+        provider_name = step.provider
+        provider_model = step.provider_model
+        retry_delay = step.retry_delay
+        retry_count = step.retry_count
+        subproviders_ordering = step.subproviders # openrouter support for subproviders ordering
 
-        provider_base_url = provider_config.baseUrl
-        api_key_env_var_or_keyvalue = provider_config.apikey
-        provider_api_key = os.getenv(api_key_env_var_or_keyvalue)
+        if provider_breaker.is_open(provider_name):
+            logging.warning(f"Skipping provider '{provider_name}' for model '{requested_model}': circuit open after recent failures.")
+            last_error_detail = f"Provider '{provider_name}' skipped (circuit open after recent failures)."
+            continue
 
-        # if the key id not found in the env var, use it as a key value because user might have set it directly in the config file
-        if not provider_api_key and api_key_env_var_or_keyvalue:
-             provider_api_key = api_key_env_var_or_keyvalue
+        logging.info(f"Attempting  model '{requested_model}' in provider: {provider_name} for subproviders ordering: {subproviders_ordering}")
 
-        headers = {
-            "Content-Type": "application/json",
-            "HTTP-Referer": "https://github.com/fabiojbg/LLMApiGateway",
-            "X-Title": "LLMGateway",
-            # Add Authorization header only if api_key is present
-            **({"Authorization": f"Bearer {provider_api_key}"} if provider_api_key else {})
-        }
-        
-        target_url = f"{provider_base_url.rstrip('/')}/chat/completions" # Ensure single slash
-        payload = copy.deepcopy(request_body_json)
+        # Compiled at config load: URL joined, env var resolved into the
+        # Authorization header, custom headers merged. Never mutated here.
+        headers = step.headers
+        target_url = step.target_url
+        # Shallow copy is enough: only top-level keys (model, provider,
+        # allow_fallbacks, usage...) are ever reassigned below, and the
+        # messages list is read-only on the forward path.
+        payload = request_body_json.copy()
         payload["model"] = provider_model # real provider model name                
         if provider_name == "openrouter" and "usage" not in payload:
             payload["usage"] = {"include": True }
-        custom_body_params = model_fallback_rule.get("custom_body_params", {})
-        if custom_body_params:
-            for key, value in custom_body_params.items():
-                payload[key] = value
-        custom_headers = model_fallback_rule.get("custom_headers", {})
-        if custom_headers:
-            for key, value in custom_headers.items():
-                headers[key] = value
+        if step.custom_body_params:
+            payload.update(step.custom_body_params)
 
         # --- Handle Different Provider Types ---
         
         while retry_count >= 0:
             # Case 1: Standard Provider (or fallback)
-            if not subproviders_ordering or len(subproviders_ordering) <= 0 or model_fallback_rule["use_provider_order_as_fallback"]== False: 
+            if not subproviders_ordering or step.use_provider_order_as_fallback == False:
 
                 if( subproviders_ordering and len(subproviders_ordering) > 0):
                     logging.info(f"Attempting model '{provider_model}' in provider: '{provider_name}' and subproviders ordering: {subproviders_ordering}")
@@ -139,14 +142,16 @@ async def chat_completions(request: Request):
                     payload["allow_fallbacks"] = False
 
                 # Make the request
-                response_data, error_detail = await make_llm_request(target_url, headers, payload, is_streaming)
+                response_data, error_detail = await request_fn(target_url, headers, payload)
                 #response_data = None # for debugging only
                 #error_detail = 'test error' # for debugging only
 
                 if response_data and error_detail is None:
+                    provider_breaker.record_success(provider_name)
                     logging.info(f"Connection success to model '{provider_model}' in provider '{provider_name}'. {'Starting streaming' if is_streaming else 'Waiting'} response...")
                     return response_data # Success! Return the response.
                 else:
+                    provider_breaker.record_failure(provider_name)
                     payload["messages"] = "<REMOVED>" # Remove messages from payload for logging
                     logging.warning(f"Failed attempt with model '{provider_model}' via '{provider_name}'.\r\n" \
                                     f"Error: {error_detail}\r\n" \
@@ -169,15 +174,17 @@ async def chat_completions(request: Request):
 
                     # Make the request for this specific sub-provider
                     
-                    response_data, error_detail = await make_llm_request(target_url, headers, payload, is_streaming)
+                    response_data, error_detail = await request_fn(target_url, headers, payload)
                     #response_data = None # for debugging only
                     #error_detail = 'test error' # for debugging only
 
                         
                     if response_data and error_detail is None:
+                        provider_breaker.record_success(provider_name)
                         logging.info(f"Connection success with model '{provider_model}' in provider '{provider_name}' via '{sub_provider}'. {'Starting streaming' if is_streaming else 'Received'} response...")
                         return response_data # Success! Return the response.
                     else:
+                        provider_breaker.record_failure(provider_name)
                         logging.warning(f"Failed attempt with model '{provider_model}' via '{provider_name}' and subprovider '{sub_provider}'.\r\n" \
                                         f"Error: {error_detail}\r\n" \
                                         f"Target Url: {target_url}\r\n" \
@@ -1,5 +1,7 @@
+import asyncio
 import logging
 import os
+import time
 import httpx
 import json5
 from fastapi import APIRouter, HTTPException
@@ -7,6 +9,7 @@ from fastapi import APIRouter, HTTPException
 # Relative imports from the new structure
 from ...config.loader import ConfigLoader
 from ...config.settings import settings
+from ...services.request_handler import get_http_client
 
 logger = logging.getLogger(__name__)
 
@@ -15,11 +18,22 @@ config_loader = ConfigLoader()
 providers_config = config_loader.load_providers()
 fallback_rules = config_loader.load_fallback_rules()
 
-# Initialize HTTP client (consider sharing a client instance across the app via dependency injection later)
-http_client = httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0)) # Shorter timeout for models endpoint
+# Shorter timeout for the models catalog fetch than the shared client's
+# streaming default; passed per request so the shared pool is still used.
+_MODELS_FETCH_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
 
 router = APIRouter()
 
+# Stale-while-revalidate cache for the merged models list: the upstream
+# catalog changes rarely, so requests are served from the cache and a
+# background refresh runs once the entry goes stale. A failed refresh keeps
+# the last good payload.
+_MODELS_CACHE_TTL = 600.0  # seconds
+# "task" keeps a strong reference to the in-flight refresh: the event loop
+# only holds tasks weakly, so a bare create_task() could be garbage-collected
+# mid-fetch.
+_models_cache = {"data": None, "ts": 0.0, "refreshing": False, "task": None}
+
 # Default reasoning effort variants applied to gateway models.
 # These map to reasoning effort levels for providers that support it
 # (e.g. OpenAI reasoning_effort, xAI reasoning.effort, Gemini thinking, etc).
@@ -226,7 +240,40 @@ async def get_models():
     """
     Returns a combined list of models available through the gateway's
     routing rules and the configured fallback provider.
+
+    Served from a TTL cache; stale entries trigger a background refresh
+    while the cached payload is returned immediately.
     """
+    cached = _models_cache["data"]
+    if cached is not None:
+        if (time.monotonic() - _models_cache["ts"] >= _MODELS_CACHE_TTL
+                and not _models_cache["refreshing"]):
+            _models_cache["refreshing"] = True
+            _models_cache["task"] = asyncio.create_task(_refresh_models_cache())
+        return cached
+
+    # Cold start: fetch synchronously once, then populate the cache
+    response = await _build_models_response()
+    _models_cache["data"] = response
+    _models_cache["ts"] = time.monotonic()
+    return response
+
+
+async def _refresh_models_cache():
+    """Background refresh; on failure the stale payload stays in place."""
+    try:
+        response = await _build_models_response()
+        _models_cache["data"] = response
+        _models_cache["ts"] = time.monotonic()
+        logger.info("Models cache refreshed in background.")
+    except Exception:
+        logger.warning("Background models refresh failed; keeping stale cache.", exc_info=True)
+    finally:
+        _models_cache["refreshing"] = False
+
+
+async def _build_models_response():
+    """Builds the combined models payload (gateway rules + fallback provider)."""
     gateway_models = {} # Use dict to avoid duplicates easily
     # 1. Add models defined in the gateway's fallback rules
     for model_name in fallback_rules.keys():
@@ -264,7 +311,8 @@ async def get_models():
 
                 try:
                     logger.info(f"Fetching models list from fallback provider '{fallback_provider_name}' at {target_url}")
-                    response_fallback = await http_client.get(target_url, headers=headers)
+                    response_fallback = await get_http_client().get(
+                        target_url, headers=headers, timeout=_MODELS_FETCH_TIMEOUT)
 
                     # Check for downstream errors
                     if response_fallback.status_code >= 400:
@@ -310,8 +358,3 @@ async def get_models():
         "object": "list",
         "data": response_list
     }
-
-# Consider adding a shutdown event to close the httpx client if it's managed here
-# @router.on_event("shutdown")
-# async def shutdown_event():
-#     await http_client.aclose()
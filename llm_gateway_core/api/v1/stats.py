@@ -1,6 +1,6 @@
 import logging
 from datetime import datetime, timedelta
-from fastapi import APIRouter, Request, HTTPException
+from fastapi import APIRouter, Request, HTTPException, Response
 from fastapi.responses import HTMLResponse, JSONResponse
 from pathlib import Path
 
@@ -54,8 +54,9 @@ async def get_aggregated_stats(request: Request, period: str):
         elif period == 'month':
             start_date = end_date - timedelta(days=365) # Approximately 12 months
 
+        # The DB returns a ready-made JSON array string; pass it through untouched
         aggregated_data = tokens_usage_db.get_aggregated_usage(period, start_date=start_date, end_date=end_date)
-        return JSONResponse(content=aggregated_data)
+        return Response(content=aggregated_data, media_type="application/json")
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -73,9 +74,11 @@ async def get_usage_records(request: Request, limit: int = 25, offset: int = 0):
         raise HTTPException(status_code=500, detail="Internal server error: TokensUsageDB not available.")
     
     try:
+        # records is already a JSON array string from SQLite; splice it into the envelope
         records = tokens_usage_db.get_latest_usage_records(limit=limit, offset=offset)
         total_records = tokens_usage_db.get_total_records_count()
-        return JSONResponse(content={"records": records, "total_records": total_records})
+        content = f'{{"records": {records}, "total_records": {total_records}}}'
+        return Response(content=content, media_type="application/json")
     except HTTPException as he:
         raise he
     except Exception as e:
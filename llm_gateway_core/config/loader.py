@@ -2,13 +2,18 @@ import json5
 import logging
 import os
 import sys
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel, Field, ValidationError, field_validator, RootModel, model_validator
+from typing import List, Dict, Any, Optional, Tuple
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, field_validator, RootModel, model_validator
 
 # Import settings using relative path within the package
 from .settings import settings
 
+# Project root is two levels above llm_gateway_core/config. Computed once at
+# import time so each ConfigLoader doesn't re-walk the path with .parent calls.
+_PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
 # Note: Pydantic models defined here. Consider moving them to llm_gateway_core/models/config.py
 # or similar for better separation if the models directory grows.
 class ProviderDetails(BaseModel):
@@ -56,15 +61,79 @@ class ModelFallbackConfig(BaseModel):
         return v
 
 
+# Headers shared by every forwarded request; per-step compiled headers start
+# from this and add the resolved Authorization plus any custom headers.
+_BASE_FORWARD_HEADERS = {
+    "Content-Type": "application/json",
+    "HTTP-Referer": "https://github.com/fabiojbg/LLMApiGateway",
+    "X-Title": "LLMGateway",
+}
+
+
+@dataclass(slots=True)
+class CompiledStep:
+    """One pre-resolved provider attempt: everything the chat hot path needs
+    as plain attributes — URL already joined, API key env var already
+    resolved into a ready Authorization header, custom headers merged."""
+    provider: str
+    provider_model: str
+    target_url: str
+    headers: Dict[str, str]
+    retry_delay: int
+    retry_count: int
+    subproviders: Optional[Tuple[str, ...]]
+    use_provider_order_as_fallback: bool
+    custom_body_params: Dict[str, Any]
+
+
+@dataclass(slots=True)
+class CompiledRoute:
+    """Compiled form of one gateway model's fallback sequence."""
+    rotate: bool
+    steps: List[CompiledStep]
+
+
+# TypeAdapters built once at import time. Validating the whole list in a
+# single pydantic-core call is much cheaper on the reload path than looping
+# in Python and constructing one model per entry.
+_PROVIDER_LIST_ADAPTER = TypeAdapter(List[ProviderConfig])
+_FALLBACK_RULES_ADAPTER = TypeAdapter(List[ModelFallbackConfig])
+
+
 class ConfigLoader:
     def __init__(self, providers_filename: str = "providers.json",
                  fallback_rules_filename: str = "models_fallback_rules.json"):
-        # Adjust path to go up two levels from llm_gateway_core/config to project root
-        project_root = Path(__file__).parent.parent.parent
-        self.providers_path = project_root / providers_filename
-        self.fallback_rules_path = project_root / fallback_rules_filename
+        self.providers_path = _PROJECT_ROOT / providers_filename
+        self.fallback_rules_path = _PROJECT_ROOT / fallback_rules_filename
         self.providers_config: Dict[str, ProviderDetails] = {}
-        self.fallback_rules: Dict[str, Dict[str, Any]] = {} # Store validated rules as dicts
+        self.fallback_rules: Dict[str, ModelFallbackConfig] = {} # Validated rules, keyed by gateway model name
+        self.compiled_routes: Dict[str, CompiledRoute] = {} # Pre-resolved hot-path routing table
+
+    def _parse_and_validate_providers(self) -> Dict[str, ProviderDetails]:
+        """
+        Reads, parses and validates providers.json.
+        Shared by the initial load and the reload paths; raises on any
+        parse, structural or semantic error instead of deciding how to fail.
+        """
+        # Read the whole file in one pass; json5's parser is faster with the
+        # full string upfront than driving buffered reads itself.
+        raw_provider_list = json5.loads(self.providers_path.read_bytes().decode('utf-8'))
+
+        if not isinstance(raw_provider_list, list):
+            raise ValueError(f"Invalid format in {self.providers_path.name}: Expected a list of provider entries.")
+
+        # Validate the whole list in one pydantic-core call.
+        # ProviderConfig ensures each entry has exactly one key (the provider name).
+        validated_entries = _PROVIDER_LIST_ADAPTER.validate_python(raw_provider_list)
+        providers_config_temp: Dict[str, ProviderDetails] = {}
+        for entry in validated_entries:
+            provider_name = next(iter(entry.root))
+            providers_config_temp[provider_name] = entry.root[provider_name]
+
+        if not self._perform_provider_semantic_validation(providers_config_temp, exit_on_error=False):
+            raise ValueError(f"Semantic validation failed for {self.providers_path.name}.")
+
+        return providers_config_temp
 
     def load_providers(self) -> Dict[str, ProviderDetails]:
         """Loads and validates provider configurations from the JSON file."""
@@ -74,23 +143,7 @@ class ConfigLoader:
             sys.exit(1)
 
         try:
-            with open(self.providers_path, 'r', encoding='utf-8') as f:
-                raw_mapping = json5.load(f)
-
-            providers_config_temp = {}
-            for item in raw_mapping:
-                if not isinstance(item, dict) or len(item) != 1:
-                    raise ValueError("Each provider entry must be a dictionary with a single key (provider name).")
-                provider_name = list(item.keys())[0]
-                provider_details_raw = list(item.values())[0]
-                # Validate using Pydantic model
-                providers_config_temp[provider_name] = ProviderDetails(**provider_details_raw)
-
-            self.providers_config = providers_config_temp
-            if not self._perform_provider_semantic_validation(self.providers_config, exit_on_error=True):
-                # _perform_provider_semantic_validation will log errors and sys.exit if exit_on_error is True
-                pass # Should have exited if critical error occurred
-
+            self.providers_config = self._parse_and_validate_providers()
             logging.info(f"Successfully loaded and validated providers from {self.providers_path}")
             logging.info(f"Loaded providers: {list(self.providers_config.keys())}")
             return self.providers_config
@@ -130,31 +183,96 @@ class ConfigLoader:
             sys.exit(1)
 
 
-    def load_fallback_rules(self) -> Dict[str, Dict[str, Any]]:
+    def _parse_and_validate_fallback_rules(self) -> Dict[str, ModelFallbackConfig]:
+        """
+        Reads, parses and validates models_fallback_rules.json against the
+        current providers configuration.
+        Shared by the initial load and the reload paths; raises on any
+        parse, structural or semantic error instead of deciding how to fail.
+        """
+        raw_rules = json5.loads(self.fallback_rules_path.read_bytes().decode('utf-8'))
+
+        # Validate the whole rules list in one pydantic-core call and store
+        # the validated models directly — no model_dump round-trip back to dicts.
+        validated_rules = _FALLBACK_RULES_ADAPTER.validate_python(raw_rules)
+        fallback_rules_temp = {rule.gateway_model_name: rule for rule in validated_rules}
+
+        if not self.providers_config:
+            # Ensure providers are loaded first since rule validation depends on them.
+            # load_providers exits the process itself if the file is broken.
+            logging.warning("Providers not loaded yet. Loading providers before validating fallback rules.")
+            self.load_providers()
+
+        # Snapshot the valid provider names once instead of probing the
+        # providers dict inside the nested rule loop.
+        valid_providers = frozenset(self.providers_config)
+
+        for gateway_model_name, rule in fallback_rules_temp.items():
+            if not rule.fallback_models:
+                raise ValueError(f"Gateway model '{gateway_model_name}' must have at least one fallback model defined.")
+
+            for fallback_model_rule in rule.fallback_models:
+                if not fallback_model_rule.provider:
+                    raise ValueError(f"'provider' is missing for a fallback rule under '{gateway_model_name}'.")
+                if not fallback_model_rule.model:
+                    raise ValueError(f"'model' is missing for a fallback rule under '{gateway_model_name}' (provider: {fallback_model_rule.provider}).")
+                if fallback_model_rule.provider not in valid_providers:
+                    raise ValueError(f"Invalid provider '{fallback_model_rule.provider}' used in fallback rule for '{gateway_model_name}'. Provider not found in configuration.")
+
+        return fallback_rules_temp
+
+    def _compile_step(self, rule: FallbackModelRule) -> CompiledStep:
+        """Resolves one fallback rule against the loaded providers config."""
+        provider = self.providers_config[rule.provider]
+        # Resolve the env var once at compile time; if it isn't set, the
+        # configured value may itself be the key (users can inline keys).
+        api_key = os.getenv(provider.apikey) or provider.apikey
+        headers = dict(_BASE_FORWARD_HEADERS)
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+        if rule.custom_headers:
+            headers.update(rule.custom_headers)
+        return CompiledStep(
+            provider=rule.provider,
+            provider_model=rule.model,
+            target_url=f"{provider.baseUrl.rstrip('/')}/chat/completions",
+            headers=headers,
+            retry_delay=rule.retry_delay or 0,
+            retry_count=rule.retry_count or 0,
+            subproviders=tuple(rule.providers_order) if rule.providers_order else None,
+            use_provider_order_as_fallback=rule.use_provider_order_as_fallback,
+            custom_body_params=rule.custom_body_params or {},
+        )
+
+    def compile_default_step(self, provider_name: str, model: str) -> Optional[CompiledStep]:
+        """Compiles an ad-hoc single step for models without a routing rule
+        (served by the configured fallback provider). Returns None when the
+        provider isn't configured."""
+        if provider_name not in self.providers_config:
+            return None
+        return self._compile_step(FallbackModelRule(provider=provider_name, model=model))
+
+    def _compile_routes(self):
+        """Rebuilds the routing table; called after every successful load or
+        reload of the rules or providers so the hot path never does string
+        joins, env lookups or header builds per request."""
+        self.compiled_routes = {
+            gateway_model: CompiledRoute(
+                rotate=rule_config.rotate_models,
+                steps=[self._compile_step(rule) for rule in rule_config.fallback_models],
+            )
+            for gateway_model, rule_config in self.fallback_rules.items()
+        }
+
+    def load_fallback_rules(self) -> Dict[str, ModelFallbackConfig]:
         """Loads and validates model fallback rules from the JSON file."""
         if not self.fallback_rules_path.exists():
             logging.warning(f"Model fallback rules file not found at {self.fallback_rules_path}. Proceeding without fallback rules.")
             return {}
 
         try:
-            with open(self.fallback_rules_path, 'r', encoding='utf-8') as f:
-                raw_rules = json5.load(f)
-
-            fallback_rules_temp = {}
-            # Validate each rule using the Pydantic model first
-            validated_rules = [ModelFallbackConfig(**item) for item in raw_rules]
-
-            # Convert validated Pydantic models back to dictionaries for storage
-            # This keeps the return type consistent with the original structure,
-            # although returning the Pydantic objects might be cleaner.
-            for rule in validated_rules:
-                fallback_rules_temp[rule.gateway_model_name] = {
-                    "fallback_models": [fm.model_dump(exclude_none=True) for fm in rule.fallback_models],
-                    "rotate_models": rule.rotate_models
-                }
-
-            self.fallback_rules = fallback_rules_temp
-            self._validate_fallback_rules() # Perform post-load validation
+            self.fallback_rules = self._parse_and_validate_fallback_rules()
+            self._compile_routes()
             logging.info(f"Successfully loaded and validated model fallback rules from {self.fallback_rules_path}")
             logging.info(f"Loaded model rules for: {list(self.fallback_rules.keys())}")
             return self.fallback_rules
@@ -171,66 +289,21 @@ class ConfigLoader:
             return False
 
         try:
-            with open(self.fallback_rules_path, 'r', encoding='utf-8') as f:
-                raw_rules = json5.load(f)
-
-            fallback_rules_temp = {}
-            validated_rules = [ModelFallbackConfig(**item) for item in raw_rules]
-
-            for rule in validated_rules:
-                fallback_rules_temp[rule.gateway_model_name] = {
-                    "fallback_models": [fm.model_dump(exclude_none=True) for fm in rule.fallback_models],
-                    "rotate_models": rule.rotate_models
-                }
-            
-            # Perform validation before assigning to self.fallback_rules
-            # This requires a temporary way to call _validate_fallback_rules or its logic
-            # For simplicity here, we'll assume _validate_fallback_rules can be adapted or its core logic used.
-            # A more robust solution might involve passing the temporary rules to a validation method.
-            
-            # Temporarily assign to a new variable to validate
-            potential_new_rules = fallback_rules_temp
-            
-            # Validate the potential new rules (adapting _validate_fallback_rules logic)
-            if not self.providers_config:
-                 logging.warning("Providers not loaded. Cannot validate fallback rules during reload.")
-                 # Attempt to load providers if not already loaded, but don't exit on failure here.
-                 if not self.load_providers(): # Assuming load_providers could also return bool or not exit
-                     logging.error("Failed to load providers during fallback rule reload. Validation skipped.")
-                     # Decide if to proceed without validation or return False
-                     # For now, let's be strict and return False if providers can't be loaded for validation
-                     return False
-
-
-            for gateway_model_name, config in potential_new_rules.items():
-                fallback_models = config.get("fallback_models", [])
-                if not fallback_models:
-                    logging.error(f"During reload, gateway model '{gateway_model_name}' must have at least one fallback model defined.")
-                    return False
-                for fallback_model_rule in fallback_models:
-                    provider = fallback_model_rule.get("provider")
-                    model = fallback_model_rule.get("model")
-                    if not provider:
-                        logging.error(f"During reload, 'provider' is missing for a fallback rule under '{gateway_model_name}'.")
-                        return False
-                    if not model:
-                        logging.error(f"During reload, 'model' is missing for a fallback rule under '{gateway_model_name}' (provider: {provider}).")
-                        return False
-                    if provider not in self.providers_config:
-                        logging.error(f"During reload, invalid provider '{provider}' used in fallback rule for '{gateway_model_name}'. Provider not found.")
-                        return False
-
-            # If all validations pass, update the actual instance rules
-            self.fallback_rules = potential_new_rules
+            # Only assign on success so a bad reload keeps the running rules intact
+            self.fallback_rules = self._parse_and_validate_fallback_rules()
+            self._compile_routes()
             logging.info(f"Successfully reloaded and validated model fallback rules from {self.fallback_rules_path}")
             logging.info(f"Reloaded model rules for: {list(self.fallback_rules.keys())}")
             return True
 
         except ValidationError as ve:
-            logging.error(f"Validation error during reload of '{self.fallback_rules_path.name}': {ve.errors()}", exc_info=False) # No need for full stack for validation
+            # No need for full stack for validation; %s defers formatting until emit
+            logging.error("Validation error during reload of '%s': %s", self.fallback_rules_path.name, ve.errors())
             return False
         except Exception as e:
-            logging.error(f"Failed to reload or validate '{self.fallback_rules_path.name}': {str(e)}", exc_info=True)
+            # Reload failures are expected (bad edits to the file); skip the
+            # costly traceback capture and let the message carry the cause.
+            logging.error("Failed to reload or validate '%s': %s", self.fallback_rules_path.name, e)
             return False
 
     def reload_providers_config(self) -> bool:
@@ -244,71 +317,16 @@ class ConfigLoader:
             return False
 
         try:
-            with open(self.providers_path, 'r', encoding='utf-8') as f:
-                raw_provider_list = json5.load(f)
-
-            if not isinstance(raw_provider_list, list):
-                logging.error(f"Invalid format in {self.providers_path.name}: Expected a list of provider entries.")
-                return False
-
-            potential_new_providers_config: Dict[str, ProviderDetails] = {}
-            for item_dict in raw_provider_list:
-                # Validate the structure of each item in the list using ProviderConfig
-                # ProviderConfig expects a dict like {"provider_name": ProviderDetails_dict}
-                validated_entry = ProviderConfig.model_validate(item_dict)
-                
-                # Extract the provider name and details
-                # Since ProviderConfig ensures item_dict has one key after validation:
-                provider_name = list(validated_entry.root.keys())[0]
-                provider_details = validated_entry.root[provider_name] # This is already a ProviderDetails instance
-                potential_new_providers_config[provider_name] = provider_details
-            
-            # Perform semantic validation on the successfully parsed and structurally validated providers
-            if not self._perform_provider_semantic_validation(potential_new_providers_config, exit_on_error=False):
-                logging.error(f"Semantic validation failed during reload of {self.providers_path.name}.")
-                return False # Semantic validation failed (e.g., fallback provider missing)
-
-            # If all validations pass, update the actual instance config
-            self.providers_config = potential_new_providers_config
+            # Only assign on success so a bad reload keeps the running config intact
+            self.providers_config = self._parse_and_validate_providers()
+            self._compile_routes()  # auth headers and URLs depend on providers
             logging.info(f"Successfully reloaded and validated providers from {self.providers_path}")
             logging.info(f"Reloaded providers: {list(self.providers_config.keys())}")
             return True
 
         except ValidationError as ve:
-            logging.error(f"Validation error during reload of '{self.providers_path.name}': {ve.errors()}", exc_info=False)
+            logging.error("Validation error during reload of '%s': %s", self.providers_path.name, ve.errors())
             return False
         except Exception as e:
-            logging.error(f"Failed to reload or validate '{self.providers_path.name}': {str(e)}", exc_info=True)
+            logging.error("Failed to reload or validate '%s': %s", self.providers_path.name, e)
             return False
-
-    def _validate_fallback_rules(self):
-        """Performs post-load validation on fallback rules."""
-        if not self.providers_config:
-             # Ensure providers are loaded first if validation depends on them
-             logging.warning("Providers not loaded yet. Loading providers before validating fallback rules.")
-             self.load_providers()
-             if not self.providers_config:
-                 logging.error("Failed to load providers, cannot validate fallback rules.")
-                 sys.exit(1)
-
-
-        for gateway_model_name, config in self.fallback_rules.items():
-            fallback_models = config.get("fallback_models", [])
-            if not fallback_models:
-                logging.error(f"Gateway model '{gateway_model_name}' must have at least one fallback model defined.")
-                sys.exit(1)
-
-            for fallback_model_rule in fallback_models:
-                # Access dictionary keys directly now
-                provider = fallback_model_rule.get("provider")
-                model = fallback_model_rule.get("model")
-
-                if not provider:
-                    logging.error(f"'provider' is missing for a fallback rule under '{gateway_model_name}'.")
-                    sys.exit(1)
-                if not model:
-                     logging.error(f"'model' is missing for a fallback rule under '{gateway_model_name}' (provider: {provider}).")
-                     sys.exit(1)
-                if provider not in self.providers_config:
-                    logging.error(f"Invalid provider '{provider}' used in fallback rule for '{gateway_model_name}'. Provider not found in configuration.")
-                    sys.exit(1)
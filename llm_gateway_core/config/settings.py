@@ -3,9 +3,13 @@ from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
 
 # Load .env file from the project root (assuming run.py is in the root)
-# Adjust the path if the execution context changes
+# Adjust the path if the execution context changes.
+# Only parse it when the key settings are not already in the environment
+# (e.g. containerized deployments inject them via the orchestrator), and
+# don't let a stale .env override platform-provided variables.
 dotenv_path = os.path.join(os.path.dirname(__file__), '..', '..', '.env')
-load_dotenv(dotenv_path=dotenv_path, override=True)
+if not os.getenv("GATEWAY_API_KEY") and os.path.exists(dotenv_path):
+    load_dotenv(dotenv_path=dotenv_path)
 
 class Settings(BaseSettings):
     # It's generally better practice to load .env once at the start
@@ -1,8 +1,29 @@
 import sqlite3
 import os
 import logging
+import threading
+import time
 from pathlib import Path
 
+# Project root is two levels above llm_gateway_core/db. Computed once at
+# import time instead of re-walking .parent chains per instance.
+_PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+# Statement texts kept as module constants so sqlite3's internal statement
+# cache always sees the exact same strings and never re-prepares them.
+_SQL_SELECT_INDEX = "SELECT last_model_index FROM model_rotation WHERE api_key = ? AND gateway_model = ?"
+_SQL_INSERT_INDEX = "INSERT INTO model_rotation (api_key, gateway_model, last_model_index) VALUES (?, ?, ?)"
+_SQL_UPDATE_INDEX = "UPDATE model_rotation SET last_model_index = ? WHERE api_key = ? AND gateway_model = ?"
+_SQL_UPSERT_INDEX = '''
+INSERT INTO model_rotation (api_key, gateway_model, last_model_index)
+VALUES (?, ?, ?)
+ON CONFLICT (api_key, gateway_model)
+DO UPDATE SET last_model_index = excluded.last_model_index
+'''
+
+# How often the background flusher persists dirty in-memory counters.
+_FLUSH_INTERVAL = 1.0
+
 class ModelRotationDB:
     def __init__(self, db_filename: str = "llmgateway_rotation.db"):
         """
@@ -12,9 +33,7 @@ class ModelRotationDB:
             db_filename: The name of the SQLite database file.
                          It will be created in a 'db' directory at the project root.
         """
-        # Determine project root (assuming this file is in llm_gateway_core/db)
-        project_root = Path(__file__).parent.parent.parent
-        db_dir = project_root / "db" # Place DB in a root-level 'db' directory
+        db_dir = _PROJECT_ROOT / "db" # Place DB in a root-level 'db' directory
         db_path = db_dir / db_filename
 
         # Ensure the directory exists
@@ -23,6 +42,17 @@ class ModelRotationDB:
         self.db_path = db_path
         self._init_db()
 
+        # In-memory counters keyed by (api_key, gateway_model): the rotation
+        # hot path is dict ops only, with SQLite touched once per key to seed
+        # and then only from the background flusher (debounced batch upserts),
+        # so the event loop never waits on a commit per request.
+        self._counters = {}
+        self._dirty = {}
+        self._lock = threading.Lock()
+        flusher = threading.Thread(target=self._flush_loop,
+                                   name="rotation-flush", daemon=True)
+        flusher.start()
+
     def _init_db(self):
         """
         Initialize the database schema if it doesn't exist.
@@ -42,6 +72,9 @@ class ModelRotationDB:
             )
             ''')
 
+            # Larger page cache (~8 MB) so the small rotation table stays in memory
+            cursor.execute("PRAGMA cache_size=-8000")
+
             conn.commit()
             logging.info(f"Model rotation database initialized at {self.db_path}")
         except Exception as e:
@@ -69,42 +102,84 @@ class ModelRotationDB:
             logging.warning("Cannot get next model index with zero or negative total models.")
             return 0 # Or raise an error?
 
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+        key = (api_key, gateway_model)
+        with self._lock:
+            if key in self._counters:
+                next_index = (self._counters[key] + 1) % total_models
+                self._counters[key] = next_index
+                self._dirty[key] = next_index
+                return next_index
 
-            # Get the current index
-            cursor.execute(
-                "SELECT last_model_index FROM model_rotation WHERE api_key = ? AND gateway_model = ?",
-                (api_key, gateway_model)
-            )
-            result = cursor.fetchone()
-
-            if result is None:
+        # Cold key: seed from the backing store once, outside the lock so the
+        # one-time read never serializes other requests.
+        stored = self._read_index(key)
+        with self._lock:
+            if key in self._counters:
+                # Another request seeded this key while we were reading
+                next_index = (self._counters[key] + 1) % total_models
+            elif stored is None:
                 # First time this API key and model are used
                 next_index = 0
-                cursor.execute(
-                    "INSERT INTO model_rotation (api_key, gateway_model, last_model_index) VALUES (?, ?, ?)",
-                    (api_key, gateway_model, next_index)
-                )
             else:
-                current_index = result[0]
                 # Calculate the next index with wraparound
-                next_index = (current_index + 1) % total_models
-                cursor.execute(
-                    "UPDATE model_rotation SET last_model_index = ? WHERE api_key = ? AND gateway_model = ?",
-                    (next_index, api_key, gateway_model)
-                )
+                next_index = (stored + 1) % total_models
+            self._counters[key] = next_index
+            self._dirty[key] = next_index
+            return next_index
 
+    def _read_index(self, key):
+        """One-time seed read for a rotation counter; None means no row (or
+        a read error, which degrades to starting at index 0)."""
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.execute(_SQL_SELECT_INDEX, key)
+            result = cursor.fetchone()
+            return result[0] if result else None
+        except Exception as e:
+            logging.error(f"Error reading model rotation index for key='{key[0][:5]}...', model='{key[1]}': {str(e)}")
+            return None
+        finally:
+            if conn:
+                conn.close()
+
+    def _flush_loop(self):
+        """Debounced persistence: snapshot dirty counters at most once per
+        interval and upsert them in a single transaction."""
+        while True:
+            time.sleep(_FLUSH_INTERVAL)
+            with self._lock:
+                if not self._dirty:
+                    continue
+                rows = [(api_key, gateway_model, index)
+                        for (api_key, gateway_model), index in self._dirty.items()]
+                self._dirty.clear()
+            self.bulk_update(rows)
+
+    def bulk_update(self, rows: list):
+        """
+        Upsert many rotation indexes in a single transaction.
+
+        Intended for background/batched flush paths where per-row commits
+        would each pay an fsync. Uses executemany so the statement is
+        prepared once and the whole batch commits together.
+
+        Args:
+            rows: List of (api_key, gateway_model, last_model_index) tuples.
+        """
+        if not rows:
+            return
+
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.executemany(_SQL_UPSERT_INDEX, rows)
             conn.commit()
-            return next_index
+            logging.debug(f"Bulk-updated {len(rows)} model rotation entries.")
         except Exception as e:
-            logging.error(f"Error getting next model index for key='{api_key[:5]}...', model='{gateway_model}': {str(e)}")
+            logging.error(f"Error bulk-updating model rotation entries: {str(e)}")
             if conn:
                 conn.rollback()
-            # Default to first model in case of error to ensure graceful degradation
-            return 0
         finally:
             if conn:
                 conn.close()
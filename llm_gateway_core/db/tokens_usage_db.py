@@ -1,9 +1,67 @@
 import sqlite3
 import os
 import logging
+import queue
+import threading
+import time
 from pathlib import Path
 from datetime import datetime, timedelta
 
+# Project root is two levels above llm_gateway_core/db. Computed once at
+# import time instead of re-walking .parent chains per instance.
+_PROJECT_ROOT = Path(__file__).resolve().parents[2]
+
+# Statement texts kept as module constants so sqlite3's internal statement
+# cache always sees the exact same strings and never re-prepares them.
+_INSERT_SQL = '''
+INSERT INTO tokens_usage
+(timestamp, ts_epoch, prompt_tokens, completion_tokens, total_tokens,
+ reasoning_tokens, cached_tokens, cost, model, provider)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+# SQLite builds the JSON array itself (json_group_array/json_object), so the
+# rows never round-trip through Python dicts before serialization.
+_SELECT_LATEST_JSON_SQL = """
+SELECT json_group_array(json_object(
+    'id', id,
+    'timestamp', timestamp,
+    'prompt_tokens', prompt_tokens,
+    'completion_tokens', completion_tokens,
+    'total_tokens', total_tokens,
+    'reasoning_tokens', reasoning_tokens,
+    'cached_tokens', cached_tokens,
+    'cost', cost,
+    'model', model,
+    'provider', provider))
+FROM (
+    SELECT *
+    FROM tokens_usage
+    ORDER BY timestamp DESC
+    LIMIT ? OFFSET ?
+)
+"""
+
+# Retention deletes run in bounded batches so the write lock is only held
+# for ~_DELETE_BATCH_ROWS rows at a time (SQLite has a single writer).
+_DELETE_OLD_BATCH_SQL = '''
+DELETE FROM tokens_usage
+WHERE id IN (
+    SELECT id FROM tokens_usage
+    WHERE timestamp < ?
+    ORDER BY timestamp
+    LIMIT ?
+)
+'''
+_DELETE_BATCH_ROWS = 1000
+
+_COUNT_SQL = "SELECT COUNT(*) FROM tokens_usage"
+
+# Write-behind tuning: the flush thread wakes at least this often and
+# commits at most this many rows per transaction.
+_FLUSH_INTERVAL_SECONDS = 1.0
+_FLUSH_MAX_ROWS = 500
+
 class TokensUsageDB:
     def __init__(self, db_filename: str = "tokens_usage.db"):
         """
@@ -13,60 +71,170 @@ class TokensUsageDB:
             db_filename: The name of the SQLite database file.
                          It will be created in a 'db' directory at the project root.
         """
-        # Determine project root (assuming this file is in llm_gateway_core/db)
-        project_root = Path(__file__).parent.parent.parent
-        db_dir = project_root / "db"  # Place DB in a root-level 'db' directory
+        db_dir = _PROJECT_ROOT / "db"  # Place DB in a root-level 'db' directory
         db_path = db_dir / db_filename
 
         # Ensure the directory exists
         os.makedirs(db_dir, exist_ok=True)
 
         self.db_path = db_path
+        # One long-lived connection shared by all methods: reopening per call
+        # re-parses PRAGMAs and re-maps the WAL/shm files each time.
+        # check_same_thread=False because inserts come from the chat-logging
+        # worker thread while reads come from the API; the lock serializes access.
+        # cached_statements above the default 128 total statements keeps all of
+        # this module's queries permanently prepared on the shared connection.
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                     cached_statements=128)
+        # Rows come back as sqlite3.Row (C-level, named access); converted to
+        # plain dicts only at the JSON boundary.
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
         self._init_db()
 
+        # Write-behind queue: insert_usage only enqueues; a daemon thread
+        # batches rows into one transaction so a single fsync is amortized
+        # across the whole batch and the request path never waits on disk.
+        self._queue = queue.SimpleQueue()
+        self._closing = threading.Event()
+        self._flush_thread = threading.Thread(target=self._flush_loop,
+                                              name="tokens-usage-flush", daemon=True)
+        self._flush_thread.start()
+
     def _init_db(self):
         """
         Initialize the database schema if it doesn't exist.
         """
-        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # Create table for tracking token usage
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tokens_usage (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME NOT NULL,
-                prompt_tokens INTEGER DEFAULT 0,
-                completion_tokens INTEGER DEFAULT 0,
-                total_tokens INTEGER DEFAULT 0,
-                reasoning_tokens INTEGER DEFAULT 0,
-                cached_tokens INTEGER DEFAULT 0,
-                cost REAL DEFAULT 0.0,
-                model TEXT,
-                provider TEXT
-            )
-            ''')
-
-            # Create index on timestamp for efficient cleanup
-            cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_tokens_usage_timestamp 
-            ON tokens_usage (timestamp)
-            ''')
-
-            conn.commit()
+            with self._lock:
+                cursor = self._conn.cursor()
+
+                # WAL mode turns each insert's two rollback-journal fsyncs into a
+                # single WAL append and lets the stats dashboard read while the
+                # request path writes. journal_mode persists in the database file,
+                # but re-applying it here is harmless. synchronous=NORMAL is safe
+                # in WAL mode (at most the last transaction is lost on power cut).
+                # Applied before any DML below opens an implicit transaction,
+                # since the safety level can't change mid-transaction.
+                # Incremental autovacuum lets freed pages be reclaimed in
+                # small steps after retention deletes, instead of a full
+                # VACUUM rewrite. Only takes effect on databases created
+                # with it (or after a one-off VACUUM); harmless otherwise.
+                cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.execute("PRAGMA temp_store=MEMORY")
+                cursor.execute("PRAGMA cache_size=-64000")
+
+                # Create table for tracking token usage
+                cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tokens_usage (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp DATETIME NOT NULL,
+                    prompt_tokens INTEGER DEFAULT 0,
+                    completion_tokens INTEGER DEFAULT 0,
+                    total_tokens INTEGER DEFAULT 0,
+                    reasoning_tokens INTEGER DEFAULT 0,
+                    cached_tokens INTEGER DEFAULT 0,
+                    cost REAL DEFAULT 0.0,
+                    model TEXT,
+                    provider TEXT
+                )
+                ''')
+
+                # Create index on timestamp for efficient cleanup
+                cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_tokens_usage_timestamp
+                ON tokens_usage (timestamp)
+                ''')
+
+                # Migrate older databases: ts_epoch holds unix seconds so the
+                # aggregate queries can bucket by integer division instead of
+                # running strftime on the ISO text for every row.
+                columns = {row[1] for row in cursor.execute("PRAGMA table_info(tokens_usage)")}
+                if "ts_epoch" not in columns:
+                    cursor.execute("ALTER TABLE tokens_usage ADD COLUMN ts_epoch INTEGER")
+                # Backfill rows written before the column existed ('utc' converts
+                # the naive local ISO timestamp to a true unix epoch).
+                cursor.execute('''
+                UPDATE tokens_usage
+                SET ts_epoch = CAST(strftime('%s', timestamp, 'utc') AS INTEGER)
+                WHERE ts_epoch IS NULL
+                ''')
+
+                # Covering index for the aggregate queries: range scan on
+                # ts_epoch with every summed column available from the index,
+                # so no B+tree lookups back into the table.
+                cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_tokens_usage_epoch_model
+                ON tokens_usage (ts_epoch, model, prompt_tokens, completion_tokens,
+                                 total_tokens, reasoning_tokens, cached_tokens, cost)
+                ''')
+
+                self._conn.commit()
+
+                # Keep planner statistics fresh so the epoch index stays
+                # chosen for range-bounded aggregates. analysis_limit bounds
+                # how many rows PRAGMA optimize may scan, so this is cheap
+                # even on a large table.
+                cursor.execute("PRAGMA analysis_limit=1000")
+                cursor.execute("PRAGMA optimize")
             logging.info(f"Tokens usage database initialized at {self.db_path}")
         except Exception as e:
             logging.error(f"Error initializing tokens usage database: {str(e)}")
-            if conn:
-                conn.rollback()
+            self._conn.rollback()
             raise  # Re-raise the exception after logging
-        finally:
-            if conn:
-                conn.close()
 
-    def get_latest_usage_records(self, limit: int = 25, offset: int = 0):
+    def close(self):
+        """Flush pending rows and close the connection (e.g. at application shutdown)."""
+        self._closing.set()
+        self._flush_thread.join(timeout=5)
+        with self._lock:
+            self._conn.close()
+
+    def _flush_loop(self):
+        """Background loop draining the insert queue into batched transactions."""
+        while not self._closing.is_set():
+            try:
+                rows = [self._queue.get(timeout=_FLUSH_INTERVAL_SECONDS)]
+            except queue.Empty:
+                continue
+            while len(rows) < _FLUSH_MAX_ROWS:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._flush_rows(rows)
+
+        # Drain whatever arrived between the last flush and close()
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if rows:
+            self._flush_rows(rows)
+
+    def _flush_rows(self, rows: list):
+        """Write a batch of usage rows in a single transaction.
+
+        Each queued row starts with a raw time.time() float; the ISO text and
+        epoch columns are derived here, off the request path.
+        """
+        try:
+            rows = [(datetime.fromtimestamp(ts).isoformat(), int(ts), *rest)
+                    for ts, *rest in rows]
+            with self._lock:
+                self._conn.executemany(_INSERT_SQL, rows)
+                self._conn.commit()
+            logging.debug(f"Flushed {len(rows)} token usage rows to database.")
+        except Exception as e:
+            logging.error(f"Error flushing token usage rows: {str(e)}")
+            with self._lock:
+                self._conn.rollback()
+
+    def get_latest_usage_records(self, limit: int = 25, offset: int = 0) -> str:
         """
         Retrieve the latest token usage records with pagination.
 
@@ -75,46 +243,19 @@ class TokensUsageDB:
             offset (int): The number of records to skip. Defaults to 0.
 
         Returns:
-            list[dict]: A list of dictionaries, each representing a token usage record.
+            str: A JSON array string with one object per token usage record,
+                 serialized directly by SQLite.
         """
-        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with self._lock:
+                result = self._conn.execute(_SELECT_LATEST_JSON_SQL, (limit, offset)).fetchone()[0]
 
-            query = f"""
-            SELECT
-                id,
-                timestamp,
-                prompt_tokens,
-                completion_tokens,
-                total_tokens,
-                reasoning_tokens,
-                cached_tokens,
-                cost,
-                model,
-                provider
-            FROM
-                tokens_usage
-            ORDER BY
-                timestamp DESC
-            LIMIT ? OFFSET ?
-            """
-            cursor.execute(query, (limit, offset))
-            
-            rows = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            results = [dict(zip(columns, row)) for row in rows]
-            
-            logging.debug(f"Retrieved {len(results)} latest token usage records (limit={limit}, offset={offset}).")
-            return results
+            logging.debug(f"Retrieved latest token usage records (limit={limit}, offset={offset}).")
+            return result
 
         except Exception as e:
             logging.error(f"Error retrieving latest token usage records: {str(e)}")
-            return []
-        finally:
-            if conn:
-                conn.close()
+            return "[]"
 
     def insert_usage(self, tokens_usage: dict):
         """
@@ -126,40 +267,24 @@ class TokensUsageDB:
                 - reasoning_tokens, cached_tokens, cost
                 - model, provider (optional)
         """
-        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # Prepare data for insertion
-            timestamp = datetime.now().isoformat()
-            prompt_tokens = tokens_usage.get('prompt_tokens', 0)
-            completion_tokens = tokens_usage.get('completion_tokens', 0)
-            total_tokens = tokens_usage.get('total_tokens', 0)
-            reasoning_tokens = tokens_usage.get('reasoning_tokens', 0)
-            cached_tokens = tokens_usage.get('cached_tokens', 0)
-            cost = tokens_usage.get('cost', 0.0)
-            model = tokens_usage.get('model')
-            provider = tokens_usage.get('provider')
-
-            cursor.execute('''
-            INSERT INTO tokens_usage 
-            (timestamp, prompt_tokens, completion_tokens, total_tokens, 
-             reasoning_tokens, cached_tokens, cost, model, provider)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (timestamp, prompt_tokens, completion_tokens, total_tokens,
-                  reasoning_tokens, cached_tokens, cost, model, provider))
-
-            conn.commit()
-            logging.debug(f"Inserted token usage data into database: {tokens_usage}")
+            # Only enqueue here; the flush thread owns the actual write and
+            # derives the timestamp columns, so this path is a single clock
+            # read plus a tuple pack — no datetime allocation or formatting.
+            row = (time.time(),
+                   tokens_usage.get('prompt_tokens', 0),
+                   tokens_usage.get('completion_tokens', 0),
+                   tokens_usage.get('total_tokens', 0),
+                   tokens_usage.get('reasoning_tokens', 0),
+                   tokens_usage.get('cached_tokens', 0),
+                   tokens_usage.get('cost', 0.0),
+                   tokens_usage.get('model'),
+                   tokens_usage.get('provider'))
+            self._queue.put(row)
+            logging.debug(f"Queued token usage data for database insert: {tokens_usage}")
         except Exception as e:
-            logging.error(f"Error inserting token usage data: {str(e)}")
-            if conn:
-                conn.rollback()
+            logging.error(f"Error queuing token usage data: {str(e)}")
             # Don't raise the exception to avoid breaking the logging functionality
-        finally:
-            if conn:
-                conn.close()
 
     def cleanup_old_records(self, retention_days: int = 180):
         """
@@ -168,34 +293,39 @@ class TokensUsageDB:
         Args:
             retention_days: Number of days to keep records (default 180 for 6 months)
         """
-        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
             # Calculate cutoff date
             cutoff_date = (datetime.now() - timedelta(days=retention_days)).isoformat()
 
-            cursor.execute('''
-            DELETE FROM tokens_usage 
-            WHERE timestamp < ?
-            ''', (cutoff_date,))
+            # Delete in bounded batches, committing each one, so the write
+            # lock is never held for a multi-second sweep; WAL readers are
+            # unaffected and queued inserts interleave between batches.
+            deleted_count = 0
+            while True:
+                with self._lock:
+                    cursor = self._conn.execute(_DELETE_OLD_BATCH_SQL,
+                                                (cutoff_date, _DELETE_BATCH_ROWS))
+                    deleted_count += cursor.rowcount
+                    self._conn.commit()
+                if cursor.rowcount < _DELETE_BATCH_ROWS:
+                    break
+
+            with self._lock:
+                # Reclaim freed pages a little at a time (no-op unless the
+                # database was created with auto_vacuum=INCREMENTAL), then
+                # refresh planner stats after the distribution shift.
+                self._conn.execute("PRAGMA incremental_vacuum(256)")
+                self._conn.execute("PRAGMA optimize")
 
-            deleted_count = cursor.rowcount
-            conn.commit()
-            
             if deleted_count > 0:
                 logging.info(f"Cleaned up {deleted_count} old token usage records (older than {retention_days} days)")
             else:
                 logging.debug("No old token usage records to clean up")
-                
+
         except Exception as e:
             logging.error(f"Error cleaning up old token usage records: {str(e)}")
-            if conn:
-                conn.rollback()
-        finally:
-            if conn:
-                conn.close()
+            with self._lock:
+                self._conn.rollback()
 
     def get_total_records_count(self):
         """
@@ -204,20 +334,14 @@ class TokensUsageDB:
         Returns:
             int: The total count of records.
         """
-        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM tokens_usage")
-            count = cursor.fetchone()[0]
+            with self._lock:
+                count = self._conn.execute(_COUNT_SQL).fetchone()[0]
             logging.debug(f"Total number of token usage records: {count}")
             return count
         except Exception as e:
             logging.error(f"Error retrieving total token usage records count: {str(e)}")
             return 0
-        finally:
-            if conn:
-                conn.close()
 
     def get_aggregated_usage(self, period: str, start_date: datetime = None, end_date: datetime = None):
         """
@@ -230,75 +354,113 @@ class TokensUsageDB:
             end_date (datetime, optional): The end of the date range to filter records. Defaults to None.
 
         Returns:
-            list[dict]: A list of dictionaries, each containing the aggregated usage
-                        for a specific period and model.
+            str: A JSON array string with one object per period/model bucket,
+                 serialized directly by SQLite.
         """
-        conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # Determine the date formatting string based on the period
+            # Bucket by integer division on ts_epoch where the period has a
+            # fixed width, so the per-row work is an integer divide instead of
+            # a strftime call; the label is formatted once per bucket. Months
+            # have no fixed width, so they still group by a formatted label
+            # (but from the indexed integer column).
+            # Day and week buckets must follow the *local* calendar (matching
+            # the labels), so the epoch is shifted by the current UTC offset
+            # before the divide and the shifted bucket start is formatted
+            # without 'localtime'. The offset is sampled once per query; rows
+            # written across a DST switch may land one bucket off, same as any
+            # fixed-offset grouping.
+            utc_offset = int(datetime.now().astimezone().utcoffset().total_seconds())
             if period == 'hour':
-                date_format = '%Y-%m-%d %H:00:00'
+                bucket_expr = "(ts_epoch / 3600) * 3600"
+                label_expr = "strftime('%Y-%m-%d %H:00:00', bucket, 'unixepoch', 'localtime')"
             elif period == 'day':
-                date_format = '%Y-%m-%d'
+                bucket_expr = f"((ts_epoch + {utc_offset}) / 86400) * 86400"
+                label_expr = "strftime('%Y-%m-%d', bucket, 'unixepoch')"
             elif period == 'week':
+                # Monday-aligned weeks: the epoch (1970-01-01) was a Thursday,
+                # so shift by 3 days before dividing into 7-day buckets.
                 # %W for week number (00-53) with Monday as the first day of the week
-                date_format = '%Y-W%W'
+                bucket_expr = f"(((ts_epoch + {utc_offset}) / 86400 + 3) / 7 * 7 - 3) * 86400"
+                label_expr = "strftime('%Y-W%W', bucket, 'unixepoch')"
             elif period == 'month':
-                date_format = '%Y-%m'
+                # Months have no fixed width; group directly on the label
+                bucket_expr = "strftime('%Y-%m', ts_epoch, 'unixepoch', 'localtime')"
+                label_expr = "bucket"
             else:
                 raise ValueError(f"Invalid period: {period}. Must be 'hour', 'day', 'week', or 'month'.")
 
-            # Build the WHERE clause for date filtering
+            # Build the WHERE clause for date filtering (on the indexed epoch column)
             where_clause = ""
             params = []
             if start_date:
-                where_clause += " WHERE timestamp >= ?"
-                params.append(start_date.isoformat())
+                where_clause += " WHERE ts_epoch >= ?"
+                params.append(int(start_date.timestamp()))
             if end_date:
                 if where_clause:
                     where_clause += " AND"
                 else:
                     where_clause += " WHERE"
-                where_clause += " timestamp <= ?"
-                params.append(end_date.isoformat())
+                where_clause += " ts_epoch <= ?"
+                params.append(int(end_date.timestamp()))
 
             query = f"""
-            SELECT
-                strftime('{date_format}', timestamp) as time_period,
-                model,
-                SUM(prompt_tokens) as prompt_tokens,
-                SUM(completion_tokens) as completion_tokens,
-                SUM(total_tokens) as total_tokens,
-                SUM(reasoning_tokens) as reasoning_tokens,
-                SUM(cached_tokens) as cached_tokens,
-                SUM(cost) as cost,
-                COUNT(*) as count
-            FROM
-                tokens_usage
-            {where_clause}
-            GROUP BY
-                time_period, model
-            ORDER BY
-                time_period DESC, model ASC
+            SELECT json_group_array(json_object(
+                'time_period', {label_expr},
+                'model', model,
+                'prompt_tokens', prompt_tokens,
+                'completion_tokens', completion_tokens,
+                'total_tokens', total_tokens,
+                'reasoning_tokens', reasoning_tokens,
+                'cached_tokens', cached_tokens,
+                'cost', cost,
+                'count', count))
+            FROM (
+                SELECT
+                    {bucket_expr} as bucket,
+                    model,
+                    SUM(prompt_tokens) as prompt_tokens,
+                    SUM(completion_tokens) as completion_tokens,
+                    SUM(total_tokens) as total_tokens,
+                    SUM(reasoning_tokens) as reasoning_tokens,
+                    SUM(cached_tokens) as cached_tokens,
+                    SUM(cost) as cost,
+                    COUNT(*) as count
+                FROM
+                    tokens_usage
+                {where_clause}
+                GROUP BY
+                    bucket, model
+                ORDER BY
+                    bucket DESC, model ASC
+            )
             """
-            cursor.execute(query, params)
-            
-            rows = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            results = [dict(zip(columns, row)) for row in rows]
-            
-            logging.debug(f"Retrieved aggregated token usage for period '{period}'. Records found: {len(results)}")
-            return results
+            with self._lock:
+                result = self._conn.execute(query, params).fetchone()[0]
+
+            logging.debug(f"Retrieved aggregated token usage for period '{period}'.")
+            return result
 
         except ValueError as ve:
             logging.error(f"Invalid period specified for tokens usage aggregation: {ve}")
-            return []
+            return "[]"
         except Exception as e:
             logging.error(f"Error retrieving aggregated token usage for period '{period}': {str(e)}")
-            return []
-        finally:
-            if conn:
-                conn.close()
+            return "[]"
+
+
+# Process-wide shared instance: the chat-logging writer and the stats API
+# read from the same database, so they share one connection and one flush
+# thread — and close() at shutdown drains the queue the writer actually
+# fills, instead of a second idle instance's.
+_shared_db = None
+_shared_db_lock = threading.Lock()
+
+
+def get_tokens_usage_db() -> TokensUsageDB:
+    """Return the shared TokensUsageDB, creating it on first use."""
+    global _shared_db
+    if _shared_db is None:
+        with _shared_db_lock:
+            if _shared_db is None:
+                _shared_db = TokensUsageDB()
+    return _shared_db
@@ -1,74 +1,82 @@
+import hmac
 import logging # <-- Add logging import
-from fastapi import Request, HTTPException, status
-from fastapi.security import APIKeyHeader
+from fastapi import status
 from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
 # Import settings from the new config location
 from ..config.settings import settings
 
-api_key_header = APIKeyHeader(name="Authorization", auto_error=False)
+# Path suffixes that require an API key; str.endswith(tuple) is a single
+# C-level scan, and the constant keeps the classification in one place.
+_PROTECTED_SUFFIXES = ("/chat/completion",)
 
-async def api_key_auth(request: Request, call_next):
+class ApiKeyAuthMiddleware:
     """
-    FastAPI middleware to authenticate requests using an API key in the Authorization header.
+    Pure ASGI middleware authenticating requests via the Authorization header.
+
+    Registered with app.add_middleware, so unprotected paths (the vast
+    majority) pass straight through with one suffix check — no
+    BaseHTTPMiddleware task or response channel per request.
     """
-    logging.debug(f"INCOMING REQUEST: {request.method} {request.url.path}") # <-- Log incoming request
 
-    # Skip auth for health checks or other public endpoints
-    if not request.url.path.endswith("/chat/completion"):
-        response = await call_next(request)
-        return response
+    def __init__(self, app):
+        self.app = app
 
-    try:
-        auth_header = await api_key_header(request)
-        if not auth_header:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Missing or invalid Authorization header (Bearer token expected)"
-            )
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # scope["path"] is already a plain str; request.url would parse a URL object
+        path = scope["path"]
+        logging.debug("INCOMING REQUEST: %s %s", scope["method"], path) # <-- Log incoming request
+
+        # Skip auth for health checks or other public endpoints
+        if not path.endswith(_PROTECTED_SUFFIXES):
+            await self.app(scope, receive, send)
+            return
 
-        api_key = auth_header.split("Bearer ")[1]
+        try:
+            auth_header = Headers(scope=scope).get("authorization")
+            if not auth_header or not auth_header.startswith("Bearer "):
+                await self._reject(scope, receive, send,
+                                   status.HTTP_401_UNAUTHORIZED,
+                                   "Missing or invalid Authorization header (Bearer token expected)")
+                return
+
+            api_key = auth_header[7:]  # strip the "Bearer " prefix
 
-        # Validate API key against the one loaded from settings
-        if settings.gateway_api_key and api_key != settings.gateway_api_key:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Invalid API Key"
+            # Validate API key against the one loaded from settings (constant-time compare)
+            if settings.gateway_api_key and not hmac.compare_digest(api_key, settings.gateway_api_key):
+                await self._reject(scope, receive, send,
+                                   status.HTTP_403_FORBIDDEN,
+                                   "Invalid API Key")
+                return
+            # If no gateway_api_key is set in the environment, requests are
+            # allowed through. Consider stricter behavior if a key is
+            # expected but missing.
+        except Exception as e:
+            # Catch and log unexpected errors *during* the authentication process itself
+            logging.error(f"Internal server error: {e}", exc_info=True) # <-- Log unexpected auth error
+            response = JSONResponse(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                content={"detail": f"Internal server error. Error: {e}"}
             )
-        elif not settings.gateway_api_key:
-            # If no gateway_api_key is set in the environment, log a warning
-            # and potentially allow requests (or deny all). Current behavior allows.
-            # Consider adding stricter behavior if a key is expected but missing.
-            # logging.warning("GATEWAY_API_KEY is not set. Allowing request without authentication.")
-            pass # Allow request if no key is configured
+            await response(scope, receive, send)
+            return
 
-        # Authentication passed, proceed with the next middleware/route
-        # We wrap call_next in its own try-except to log downstream errors
+        # Authentication passed, proceed with the next middleware/route.
+        # Errors raised downstream are logged here before re-raising so
+        # FastAPI's default error handling can take over.
         try:
-            response = await call_next(request)
-            return response
+            await self.app(scope, receive, send)
         except Exception as e:
-            # Log errors that occur *after* this middleware
             logging.error(f"Internal server error: {e}", exc_info=True)
-            # Re-raise the exception so FastAPI's default error handling can take over
             raise
-        
-    except HTTPException as exc:
-        # Log and return JSON response for authentication errors
-        logging.warning(f"Error in authentication. {exc.detail} (Status: {exc.status_code})") # <-- Log auth failure
-        return JSONResponse(
-            status_code=exc.status_code,
-            content={"detail": exc.detail}
-        )
-    except IndexError:
-        # Handle case where "Bearer " is present but no key follows
-        return JSONResponse(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            content={"detail": "Invalid Authorization header format"}
-        )
-    except Exception as e:
-        # Catch and log unexpected errors *during* the authentication process itself
-        logging.error(f"Internal server error: {e}", exc_info=True) # <-- Log unexpected auth error
-        return JSONResponse(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            content={"detail": f"Internal server error. Error: {e}"}
-        )
+
+    @staticmethod
+    async def _reject(scope, receive, send, status_code: int, detail: str):
+        """Log and answer an authentication failure as a JSON response."""
+        logging.warning(f"Error in authentication. {detail} (Status: {status_code})") # <-- Log auth failure
+        response = JSONResponse(status_code=status_code, content={"detail": detail})
+        await response(scope, receive, send)
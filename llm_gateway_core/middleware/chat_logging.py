@@ -1,30 +1,78 @@
 import os
-import json
-import glob
+import re
 from datetime import datetime
 import logging
 from pprint import pformat
 from ..config.settings import settings
-from fastapi import Request, Response
-from fastapi.responses import StreamingResponse
-from typing import Callable
+from starlette.datastructures import Headers
 import threading
 import queue
-import json5
-import time
-from ..db.tokens_usage_db import TokensUsageDB
+from collections import deque
+from types import MappingProxyType
+
+# SSE payloads are plain JSON, so the lenient (and slow) json5 parser is not
+# needed here. orjson is a declared dependency: its C parser is several times
+# faster than stdlib on small objects and accepts bytes directly.
+from orjson import loads as _json_loads
+from concurrent.futures import ThreadPoolExecutor
+from ..db.tokens_usage_db import get_tokens_usage_db
 
 logger = logging.getLogger(__name__)
 
-# Initialize tokens usage database
-tokens_usage_db = TokensUsageDB()
+# Shared tokens usage database (same instance the stats API reads from, so
+# its shutdown close() drains this module's queued inserts)
+tokens_usage_db = get_tokens_usage_db()
+
+# Fast path for the overwhelmingly common delta frame: pull the escaped JSON
+# string straight out of the bytes instead of materializing the whole object.
+_CONTENT_RE = re.compile(rb'"content"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+# Rewrites literal \n escape sequences inside logged JSON to real line breaks
+# in a single scan (the old double .replace() walked the content twice).
+_ESCAPED_NEWLINE_RE = re.compile(r'\\n(\\n)?')
+
+# Section separator for the log files, built once instead of per write.
+_DIVISION_LINE = "-" * 100
+
+_DATA_PREFIX = b"data: "
+
+def _strip_sse(frame):
+    """Return the JSON payload bytes of an SSE frame, or None if the frame
+    carries no JSON object (comments, [DONE] markers, keep-alives)."""
+    if frame.startswith(_DATA_PREFIX):
+        payload = frame[len(_DATA_PREFIX):].strip()
+        return payload if payload[:1] == b"{" else None
+    return frame if frame[:1] == b"{" else None
+
+# Path suffixes this middleware intercepts, matched against the raw ASGI
+# scope path so no URL object is built per request.
+_LOGGED_SUFFIXES = ("/chat/completions",)
+
+# All log files are written from this single worker so the event loop never
+# blocks on file I/O and log files keep their chronological order.
+_log_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-log-writer")
+
+# Known log files in chronological order, seeded by one scandir on the first
+# write. Rotation then becomes an O(1) popleft per excess file instead of a
+# directory scan (N stat calls) on every completion. Only ever touched from
+# the single _log_executor thread, so no locking is needed.
+_known_logs = deque()
+_known_logs_seeded = False
+
+def _seed_known_logs():
+    global _known_logs_seeded
+    os.makedirs("logs", exist_ok=True)
+    with os.scandir("./logs") as it:
+        entries = sorted((e.stat().st_mtime, e.path) for e in it if e.name.endswith(".txt"))
+    _known_logs.extend(path for _, path in entries)
+    _known_logs_seeded = True
 
 def write_log(req_headers, req_body_str, llm_response_accum, tokens_usage):
     try:
         # Create log file with the required name format: "YY-MM-DD_HH:MM:ss:mmm.txt"
         log_time = datetime.now()
-        filename = log_time.strftime("%Y-%m-%d_%H-%M-%S") + (".%03d" % (log_time.microsecond // 1000)) + ".txt"
-        division_line = "-" * 100
+        filename = f"{log_time:%Y-%m-%d_%H-%M-%S}.{log_time.microsecond // 1000:03d}.txt"
+        division_line = _DIVISION_LINE
         model = f"Model: {tokens_usage['model']}\n" if "model" in tokens_usage else ""
         provider = f"Provider: {tokens_usage['provider']}\n\n" if "provider" in tokens_usage else ""
         log_content = (
@@ -37,17 +85,21 @@ def write_log(req_headers, req_body_str, llm_response_accum, tokens_usage):
                 f"Cost: ${tokens_usage['cost']:0.6f}\n"
                 f"{model}"
                 f"{provider}"
-            f"{division_line}\nRequest Headers:\n{division_line}\n\n{pformat(req_headers, indent=2)}\n\n"
+            f"{division_line}\nRequest Headers:\n{division_line}\n\n{pformat(dict(req_headers), indent=2)}\n\n"
             f"{division_line}\nRequest Body:\n-{division_line}\n\n{req_body_str}\n\n"
             f"{division_line}\nLLM Response:\n{division_line}\n\n{llm_response_accum}"
         )
-        os.makedirs("logs", exist_ok=True)
+        if not _known_logs_seeded:
+            _seed_known_logs()
         log_path = os.path.join("./logs", filename)
 
         # Write the new log file
         with open(log_path, "w", encoding="utf-8") as f:
-            log_content = log_content.replace("\\n\\n", "\r\n\r\n").replace("\\n", "\r\n")  # replace the sequence \n inside json elements to make it more readable
+            # replace the sequence \n inside json elements to make it more readable
+            log_content = _ESCAPED_NEWLINE_RE.sub(
+                lambda m: "\r\n\r\n" if m.group(1) else "\r\n", log_content)
             f.write(log_content)
+        _known_logs.append(log_path)
 
         # Insert token usage data into database
         try:
@@ -55,210 +107,250 @@ def write_log(req_headers, req_body_str, llm_response_accum, tokens_usage):
         except Exception as db_error:
             logger.error(f"Failed to insert token usage data into database: {db_error}", exc_info=True)
 
-        # Clean up old logs if over limit
-        log_files = sorted(glob.glob(os.path.join("./logs", "*.txt")), key=os.path.getmtime)
+        # Clean up old logs if over limit: pop the oldest entries from the
+        # in-memory deque — no directory scan or stat calls per request.
         max_logs = settings.log_file_limit or 50
-        while len(log_files) > max_logs:
+        while len(_known_logs) > max_logs:
             try:
-                os.remove(log_files.pop(0))
+                os.remove(_known_logs.popleft())
             except Exception:
                 pass
     except Exception as e:
         logger.error(f"Failed to write chat log: {e}", exc_info=True)
 
-class ChunkProcessorThread(threading.Thread):
+class _LogSession:
+    """Per-request state carried through the shared chunk-processing worker."""
+    __slots__ = ("req_headers", "req_body_str", "is_real_streaming",
+                 "buffer", "response_parts", "tokens_usage")
+
     def __init__(self, req_headers, req_body_str, is_real_streaming):
-        super().__init__()
         self.req_headers = req_headers
         self.req_body_str = req_body_str
         self.is_real_streaming = is_real_streaming
-        self.queue = queue.Queue()
-        self.llm_response_accum = ""
-        self.tokens_usage = {
-            "prompt_tokens": 0,
-            "completion_tokens": 0,
-            "total_tokens": 0,
-            "reasoning_tokens": 0,
-            "cached_tokens": 0,
-            "cost": 0
-        }
-        self._stop_event = threading.Event()
-
-    def run(self):
-        buffer = ""
-        parts = [""]
-        while not self._stop_event.is_set() or self.queue.empty() is False:
-            logging.debug(f"ChunkProcessorThread: isRealStreaming={self.is_real_streaming}, queue size={self.queue.qsize()}")
-            if self.is_real_streaming : # for non-streaming, exit if queue is empty
-                try:                
-                    chunk = self.queue.get(timeout=5)  # wait max 5 seconds for a chunk before ending
-                except queue.Empty:
-                    break
+        self.buffer = bytearray()
+        # Accumulate response pieces in a list and join once at write time;
+        # += on a growing str is quadratic over long streams
+        self.response_parts = []
+        self.tokens_usage = dict(_ZERO_USAGE)
+
+
+# One long-lived worker decodes chunks for every in-flight request instead of
+# a freshly spawned thread per stream: no pthread_create/stack cost per
+# request, and interleaved streams are disambiguated by their session object.
+# The stream end is signalled by a (session, None) sentinel.
+_chunk_queue = queue.SimpleQueue()
+
+def _process_frame(session, decoded_chunk):
+    """Extract content/usage/error information from one SSE frame (bytes)."""
+    try:
+        decoded_chunk = _strip_sse(decoded_chunk)
+        if decoded_chunk is None:  # ignore if it is not a json
+            return
+
+        # Fast path: plain content deltas (no error/usage keys)
+        # don't need the whole object parsed — extract the
+        # content string and parse just that (handles escapes).
+        if b'"error"' not in decoded_chunk and b'"usage"' not in decoded_chunk:
+            match = _CONTENT_RE.search(decoded_chunk)
+            if match is not None:
+                content_piece = _json_loads(b'"' + match.group(1) + b'"')
+                if content_piece:
+                    session.response_parts.append(content_piece)
+                return
+
+        chunk_json = _json_loads(decoded_chunk)
+        if "choices" in chunk_json:
+            for choice in chunk_json["choices"]:
+                if "delta" in choice and "content" in choice["delta"]:
+                    content_piece = choice["delta"]["content"]
+                    if content_piece:
+                        session.response_parts.append(content_piece)
+                elif "message" in choice and "content" in choice["message"]:
+                    content_piece = choice["message"]["content"]
+                    if content_piece:
+                        session.response_parts.append(content_piece)
+        if "usage" in chunk_json:
+            session.tokens_usage = get_token_usage(chunk_json)
+
+        if "error" in chunk_json:
+            session.response_parts.append(decoded_chunk.decode('utf-8', errors='replace'))
+            _log_executor.submit(write_log, session.req_headers, session.req_body_str,
+                                 "".join(session.response_parts), session.tokens_usage)
+    except Exception as ex:
+        logging.error(f"ChatLogging: error processing chunk part: {decoded_chunk}: {ex}", exc_info=True)
+
+def _finalize_session(session):
+    """Process any buffered remainder and hand the log off to the writer."""
+    if not session.is_real_streaming and session.buffer:
+        # Non-SSE streaming responses arrive as one JSON body split over
+        # chunks; parse it in one go now that the stream is complete.
+        _process_frame(session, bytes(session.buffer))
+    _log_executor.submit(write_log, session.req_headers, session.req_body_str,
+                         "".join(session.response_parts), session.tokens_usage)
+
+def _chunk_worker():
+    """Shared worker loop: frames are sliced out of each session's bytearray
+    on the b"\\n\\n" boundary and handed to the JSON parser as raw bytes, so
+    JSON payloads split across chunks stay intact inside the buffer."""
+    while True:
+        session, chunk = _chunk_queue.get()
+        try:
+            if chunk is None:
+                _finalize_session(session)
+            elif session.is_real_streaming:
+                session.buffer += chunk
+                while (boundary := session.buffer.find(b"\n\n")) != -1:
+                    frame = bytes(session.buffer[:boundary])
+                    # Keep anything after the boundary in buffer (incomplete frame)
+                    del session.buffer[:boundary + 2]
+                    _process_frame(session, frame)
             else:
-                while True:
-                    try:                
-                        chunk = self.queue.get(timeout=2)  # for non-streaming, just get without waiting
-                        buffer += chunk.decode('utf-8')
-                    except queue.Empty:
-                        break
-            try:
-                if( not self.is_real_streaming):
-                   parts[0] = buffer
-                else:
-                    text = chunk.decode('utf-8')
-                    buffer += text
-                    parts = buffer.split("\n\n")
-                    # Keep the last part in buffer if incomplete
-                    buffer = parts.pop() if not buffer.endswith("\n\n") else ""
-
-                for decoded_chunk in parts:
-                    try:
-                        if not decoded_chunk.startswith("data: {") and \
-                        not decoded_chunk.startswith("{"):  # ignore if it is not a json
-                            continue
-
-                        if decoded_chunk.startswith("data: "):
-                            decoded_chunk = decoded_chunk[len('data: '):].strip()
-                            
-                        chunk_json = json5.loads(decoded_chunk)
-                        if "choices" in chunk_json:
-                            for choice in chunk_json["choices"]:
-                                if "delta" in choice and "content" in choice["delta"]:
-                                    content_piece = choice["delta"]["content"]
-                                    if content_piece:
-                                        self.llm_response_accum += content_piece
-                                elif "message" in choice and "content" in choice["message"]:
-                                    content_piece = choice["message"]["content"]
-                                    if content_piece:
-                                        self.llm_response_accum += content_piece
-                        if "usage" in chunk_json:
-                            self.tokens_usage = get_token_usage(chunk_json)
-
-                        if "error" in chunk_json:
-                            self.llm_response_accum += decoded_chunk
-                            write_log(self.req_headers, self.req_body_str, self.llm_response_accum, self.tokens_usage)
-                    except Exception as ex:
-                        logging.error(f"ChatLogging: error processing chunk part: {decoded_chunk}: {ex}", exc_info=True)
-            except Exception as ex:
-                logging.error(f"ChatLogging: error processing chunk: {chunk}: {ex}", exc_info=True)
-
-            self.queue.task_done()
-            if( not self.is_real_streaming):
-                break
-
-        # After finishing processing all chunks, write the log file
-        write_log(self.req_headers, self.req_body_str, self.llm_response_accum, self.tokens_usage)
-
-    def enqueue_chunk(self, chunk):
-        self.queue.put(chunk)
+                session.buffer += chunk
+        except Exception as ex:
+            logging.error(f"ChatLogging: error processing chunk: {chunk}: {ex}", exc_info=True)
+
+_chunk_worker_thread = threading.Thread(target=_chunk_worker,
+                                        name="chat-log-chunks", daemon=True)
+_chunk_worker_thread.start()
+
+# Canonical zeroed usage schema, shared by every site that needs a fresh
+# usage dict instead of each one repeating (and risking drift in) the literal.
+_ZERO_USAGE = MappingProxyType({
+    "prompt_tokens": 0,
+    "completion_tokens": 0,
+    "total_tokens": 0,
+    "reasoning_tokens": 0,
+    "cached_tokens": 0,
+    "cost": 0
+})
 
 def _init_tokens_and_response():
-    return "", {
-        "prompt_tokens": 0,
-        "completion_tokens": 0,
-        "total_tokens": 0,
-        "reasoning_tokens": 0,
-        "cached_tokens": 0,
-        "cost": 0
-    }
-
-async def log_chat_completions(request: Request, call_next: Callable) -> Response:
-    # Only intercept the "/v1/chat/completions" endpoint
-    if not request.url.path.endswith("/chat/completions"):
-        return await call_next(request)
+    return "", dict(_ZERO_USAGE)
 
-    try:
-        # Capture request body and headers
-        req_body_bytes = await request.body()
-        req_body_str = req_body_bytes.decode("utf-8") if req_body_bytes else ""
-        req_headers = dict(request.headers)
-    except Exception as e:
-        logger.error(f"Error capturing request body in log_chat middleware: {e}", exc_info=True)
-        response = await call_next(request)
-        return response
+class ChatLoggingMiddleware:
+    """Pure ASGI middleware for chat-completions logging.
 
-    response = await call_next(request)
-    logging.debug(f"chat_logging: Response type received by middleware: {type(response)}. Is StreamingResponse check: {isinstance(response, StreamingResponse)}")
+    Registered via app.add_middleware, so there is no BaseHTTPMiddleware
+    task/memory-channel pair per request and streamed tokens pass straight
+    through to the client. Request bytes are teed off the receive channel and
+    response chunks off the send channel after forwarding; parsing and file
+    writes stay on the shared worker threads.
+    """
 
-    try:
-        # If response is streaming, wrap its iterator to enqueue chunks for background processing
-        # Check if it's a StreamingResponse AND explicitly check Content-Type for actual event-streams
-        # Functional middlewares can sometimes convert JSONResponse into _StreamingResponse,
-        # so we need to differentiate based on content type.
-        is_real_streaming = "text/event-stream" in response.headers.get("content-type")
-        is_streaming_response = isinstance(response, StreamingResponse) or "StreamingResponse" in type(response).__name__
-        if is_streaming_response:
-            
-            logger.debug(f"chat_logging: Handling as actual StreamingResponse (Content-Type: {response.headers.get('content-type')})")
-            original_iterator = response.body_iterator
-
-            first_chunk = True
-
-            async def enqueueing_generator():
-                async for chunk in original_iterator:
-                    nonlocal first_chunk
-                    if first_chunk : # create the thread to process the chunks
-                        chunk_processor_thread = ChunkProcessorThread(req_headers, req_body_str, is_real_streaming)
-                        chunk_processor_thread.start()
-                        first_chunk = False
-
-                    # Enqueue chunk for processing
-                    chunk_processor_thread.enqueue_chunk(chunk)
-                    # Yield chunk immediately for streaming
-                    yield chunk
-
-            response.body_iterator = enqueueing_generator()
-        else:
-            # For non-streaming responses, attempt to read full body content
-            llm_response_accum, tokens_usage = _init_tokens_and_response()
-            if hasattr(response, "body") and response.body:
-                try:
-                    response_data = json.loads(response.body.decode("utf-8"))
-                    if "choices" in response_data and isinstance(response_data["choices"], list):
-                        first = response_data["choices"][0]
-                        if "message" in first and "content" in first["message"]:
-                            llm_response_accum = first["message"]["content"]
-                        if "usage" in response_data:
-                            tokens_usage = get_token_usage(response_data)
-                except Exception as ex:
-                    logging.error(f"ChatLogging: error processing chunk: {response.body}: {ex}", exc_info=True)
-            # Write log file immediately for non-streaming responses
-            write_log(req_headers, req_body_str, llm_response_accum, tokens_usage)
+    def __init__(self, app):
+        self.app = app
 
-    except Exception as e:
-        logger.error(f"Error in log_chat_completions middleware: {e}", exc_info=True)
+    async def __call__(self, scope, receive, send):
+        # Only intercept the "/v1/chat/completions" endpoint, and only when
+        # chat logging is enabled (main.py normally doesn't register the
+        # middleware at all in that case, but keep the guard cheap and explicit).
+        if (scope["type"] != "http" or not settings.log_chat_messages
+                or not scope["path"].endswith(_LOGGED_SUFFIXES)):
+            await self.app(scope, receive, send)
+            return
+
+        # Lazy Headers view over the raw scope; write_log materializes the
+        # dict on the writer thread, so the request path skips the full copy.
+        req_headers = Headers(scope=scope)
+        req_body_parts = []
 
-    return response
+        async def receive_tee():
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body")
+                if body:
+                    req_body_parts.append(body)
+            return message
+
+        def request_body_str():
+            return b"".join(req_body_parts).decode("utf-8", errors="replace") if req_body_parts else ""
+
+        session = None          # created on the first SSE body chunk
+        session_closed = False
+        is_sse = False
+        resp_content_type = ""
+        resp_body_parts = []    # non-SSE body accumulation (bounded)
+        resp_size = 0
+
+        async def send_wrapper(message):
+            nonlocal session, session_closed, is_sse, resp_content_type, resp_size
+            if message["type"] == "http.response.start":
+                resp_content_type = Headers(raw=message["headers"]).get("content-type", "")
+                is_sse = "text/event-stream" in resp_content_type
+
+            # Forward first: the client-visible stream never waits on any
+            # logging work, which is strictly best-effort.
+            await send(message)
+
+            if message["type"] != "http.response.body":
+                return
+            try:
+                chunk = message.get("body", b"")
+                more_body = message.get("more_body", False)
+                if is_sse:
+                    if session is None:
+                        session = _LogSession(req_headers, request_body_str(), True)
+                    if chunk:
+                        # Enqueue for the shared frame-processing worker
+                        _chunk_queue.put((session, chunk))
+                    if not more_body:
+                        _chunk_queue.put((session, None))
+                        session_closed = True
+                else:
+                    # Cheap gate before parsing: only JSON bodies of a sane
+                    # size are worth feeding to the parser — huge or non-JSON
+                    # payloads (error pages, binary blobs) are logged without
+                    # a decode attempt.
+                    if chunk and resp_size < 1_000_000:
+                        resp_body_parts.append(chunk)
+                        resp_size += len(chunk)
+                    if not more_body:
+                        llm_response_accum, tokens_usage = _init_tokens_and_response()
+                        body = b"".join(resp_body_parts)
+                        if body and "application/json" in resp_content_type and resp_size < 1_000_000:
+                            try:
+                                response_data = _json_loads(body)
+                                if "choices" in response_data and isinstance(response_data["choices"], list):
+                                    first = response_data["choices"][0]
+                                    if "message" in first and "content" in first["message"]:
+                                        llm_response_accum = first["message"]["content"]
+                                    if "usage" in response_data:
+                                        tokens_usage = get_token_usage(response_data)
+                            except Exception as ex:
+                                logging.error(f"ChatLogging: error processing response body: {body[:1000]}: {ex}", exc_info=True)
+                        # Hand off to the log writer thread so the event loop
+                        # isn't blocked on the file write + cleanup syscalls
+                        _log_executor.submit(write_log, req_headers, request_body_str(),
+                                             llm_response_accum, tokens_usage)
+            except Exception as e:
+                logger.error(f"Error in ChatLoggingMiddleware: {e}", exc_info=True)
+
+        try:
+            await self.app(scope, receive_tee, send_wrapper)
+        finally:
+            # Client disconnects end the stream without a final body message;
+            # make sure an open session still reaches the writer.
+            if session is not None and not session_closed:
+                _chunk_queue.put((session, None))
 
 def get_token_usage(chunk_data):
     """
     Extracts token usage information from the chunk data.
     """
-    tokens_usage = {
-        "prompt_tokens": 0,
-        "completion_tokens": 0,
-        "total_tokens": 0,
-        "reasoning_tokens" : 0,
-        "cached_tokens": 0,
-        "cost": 0
-    }
-    try:       
-        if "usage" in chunk_data and isinstance(chunk_data["usage"], dict):
-            usage = chunk_data["usage"]
-            if "prompt_tokens" in usage:
-                tokens_usage["prompt_tokens"] = usage["prompt_tokens"]
-            if "completion_tokens" in usage:
-                tokens_usage["completion_tokens"] = usage["completion_tokens"]
-            if "total_tokens" in usage:
-                tokens_usage["total_tokens"] = usage["total_tokens"]
-            if "cost" in usage:
-                tokens_usage["cost"] = usage["cost"]
-            if "completion_tokens_details" in usage and \
-            "reasoning_tokens" in usage["completion_tokens_details"]:
-                tokens_usage["reasoning_tokens"] = usage["completion_tokens_details"]["reasoning_tokens"]
-            if "prompt_tokens_details" in usage and \
-            "cached_tokens" in usage["prompt_tokens_details"]:
-                tokens_usage["cached_tokens"] = usage["prompt_tokens_details"]["cached_tokens"]
+    tokens_usage = dict(_ZERO_USAGE)
+    try:
+        usage = chunk_data.get("usage")
+        if isinstance(usage, dict):
+            tokens_usage["prompt_tokens"] = usage.get("prompt_tokens", 0)
+            tokens_usage["completion_tokens"] = usage.get("completion_tokens", 0)
+            tokens_usage["total_tokens"] = usage.get("total_tokens", 0)
+            tokens_usage["cost"] = usage.get("cost", 0)
+            completion_details = usage.get("completion_tokens_details")
+            if isinstance(completion_details, dict):
+                tokens_usage["reasoning_tokens"] = completion_details.get("reasoning_tokens", 0)
+            prompt_details = usage.get("prompt_tokens_details")
+            if isinstance(prompt_details, dict):
+                tokens_usage["cached_tokens"] = prompt_details.get("cached_tokens", 0)
             if tokens_usage["reasoning_tokens"]>0:
                 tokens_usage["completion_tokens"] = tokens_usage["completion_tokens"] - tokens_usage["reasoning_tokens"]
         if "provider" in chunk_data:
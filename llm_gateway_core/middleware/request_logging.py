@@ -20,17 +20,18 @@ class RequestLoggingMiddleware:
 
         request = Request(scope, receive)
         start_time = time.time()
-        request_id = str(uuid.uuid4()) # Generate a unique ID for each request
+        request_id = uuid.uuid4().hex # Generate a unique ID for each request (hex skips dash formatting)
 
         # Skip logging for health checks
         if request.url.path == "/health":
             return await self.app(scope, receive, send)
 
-        logging.info(f"RequestLoggingMiddleware processing {request.method} {request.url.path}")
+        logging.info("RequestLoggingMiddleware processing %s %s", request.method, request.url.path)
         # Log incoming request details
         logging.info(
-            f"Incoming request | ID: {request_id} | Method: {request.method} | "
-            f"Path: {request.url.path} | Client: {request.client.host if request.client else 'Unknown'}"
+            "Incoming request | ID: %s | Method: %s | Path: %s | Client: %s",
+            request_id, request.method, request.url.path,
+            request.client.host if request.client else "Unknown"
         )
         
         # Log request headers (masking sensitive info)
@@ -42,7 +43,7 @@ class RequestLoggingMiddleware:
             else:
                 masked_headers[k] = v
         
-        logging.info(f"Request Headers | ID: {request_id} | Headers: {masked_headers}")
+        logging.info("Request Headers | ID: %s | Headers: %s", request_id, masked_headers)
 
         body_bytes = b""
         try:
@@ -55,12 +56,12 @@ class RequestLoggingMiddleware:
                         payload["messages"] = "[MESSAGES EXCLUDED]"
                     if "tools" in payload:
                         payload["tools"] = "[TOOLS EXCLUDED]"
-                    logging.info(f"Request Payload | ID: {request_id} | Payload: {json.dumps(payload, ensure_ascii=False)}")
+                    logging.info("Request Payload | ID: %s | Payload: %s", request_id, json.dumps(payload, ensure_ascii=False))
                 except json.JSONDecodeError:
                     # Ignore if the body is not a valid JSON
                     pass
         except Exception as e:
-            logging.error(f"Error logging request payload | ID: {request_id} | Error: {str(e)}")
+            logging.error("Error logging request payload | ID: %s | Error: %s", request_id, e)
 
         # Create a custom receive to pass the body bytes downstream
         receive_called = False
@@ -83,21 +84,21 @@ class RequestLoggingMiddleware:
         try:
             await self.app(scope, custom_receive, custom_send)
             duration = round((time.time() - start_time) * 1000, 2)
-            logging.info(f"Request completed | ID: {request_id} | Status: {status_code} | Duration: {duration}ms")
+            logging.info("Request completed | ID: %s | Status: %s | Duration: %sms", request_id, status_code, duration)
         except Exception as e:
             duration = round((time.time() - start_time) * 1000, 2)
-            logging.error(f"Request failed | ID: {request_id} | Error: {str(e)} | Duration: {duration}ms", exc_info=True)
+            logging.error("Request failed | ID: %s | Error: %s | Duration: %sms", request_id, e, duration, exc_info=True)
             raise e
 
 # Keep the functional style middleware as well if preferred, but class-based is often cleaner
 async def log_middleware_functional(request: Request, call_next: Callable):
     start_time = time.time()
-    request_id = str(uuid.uuid4())
+    request_id = uuid.uuid4().hex
 
     if request.url.path == "/health":
         return await call_next(request)
 
-    logging.info(f"Incoming request | ID: {request_id} | Method: {request.method} | Path: {request.url.path} | Client: {request.client.host if request.client else 'Unknown'}")
+    logging.info("Incoming request | ID: %s | Method: %s | Path: %s | Client: %s", request_id, request.method, request.url.path, request.client.host if request.client else "Unknown")
 
     # Log request headers (masking sensitive info)
     sensitive_headers = {"authorization", "api-key", "x-api-key", "proxy-authorization"}
@@ -105,18 +106,18 @@ async def log_middleware_functional(request: Request, call_next: Callable):
         k: ("********" if k.lower() in sensitive_headers else v)
         for k, v in request.headers.items()
     }
-    logging.info(f"Request Headers | ID: {request_id} | Headers: {masked_headers}")
+    logging.info("Request Headers | ID: %s | Headers: %s", request_id, masked_headers)
 
     try:
         response = await call_next(request)
         duration = round((time.time() - start_time) * 1000, 2)
-        logging.info(f"Request completed | ID: {request_id} | Status: {response.status_code} | Duration: {duration}ms")
+        logging.info("Request completed | ID: %s | Status: %s | Duration: %sms", request_id, response.status_code, duration)
         # Add request ID header if it's a standard Response object
         if hasattr(response, "headers"):
              response.headers["X-Request-ID"] = request_id
     except Exception as e:
         duration = round((time.time() - start_time) * 1000, 2)
-        logging.error(f"Request failed | ID: {request_id} | Error: {str(e)} | Duration: {duration}ms", exc_info=True)
+        logging.error("Request failed | ID: %s | Error: %s | Duration: %sms", request_id, e, duration, exc_info=True)
         raise e
 
     return response
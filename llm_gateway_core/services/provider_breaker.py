@@ -0,0 +1,55 @@
+import logging
+import time
+
+# Consecutive failures inside the window before the circuit opens.
+_FAILURE_THRESHOLD = 3
+# Failures further apart than this don't accumulate toward the threshold.
+_FAILURE_WINDOW = 30.0
+# Open time doubles per extra failure, capped so providers are re-probed
+# within a minute of recovering.
+_BASE_BACKOFF = 5.0
+_MAX_BACKOFF = 60.0
+
+
+class ProviderBreaker:
+    """In-memory circuit breaker over provider names.
+
+    A provider that keeps failing is skipped for a backoff period instead of
+    paying a full RTT (or timeout) on every request in the fallback chain.
+    Purely best-effort and per-process: state is [failures, open_until,
+    last_failure] and a single success closes the circuit again.
+    """
+
+    def __init__(self, threshold: int = _FAILURE_THRESHOLD,
+                 window: float = _FAILURE_WINDOW,
+                 base_backoff: float = _BASE_BACKOFF,
+                 max_backoff: float = _MAX_BACKOFF):
+        self._threshold = threshold
+        self._window = window
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._states = {}
+
+    def is_open(self, provider: str) -> bool:
+        """True while the provider's backoff period is still running."""
+        state = self._states.get(provider)
+        return state is not None and state[1] > time.monotonic()
+
+    def record_success(self, provider: str):
+        """A successful attempt closes the circuit and clears the history."""
+        self._states.pop(provider, None)
+
+    def record_failure(self, provider: str):
+        """Counts a failed attempt; at the threshold the circuit opens with
+        exponential backoff (doubling per further failure, capped)."""
+        now = time.monotonic()
+        state = self._states.setdefault(provider, [0, 0.0, now])
+        if now - state[2] > self._window:
+            state[0] = 0  # stale history; start a fresh streak
+        state[0] += 1
+        state[2] = now
+        if state[0] >= self._threshold:
+            backoff = min(self._base_backoff * (2 ** (state[0] - self._threshold)),
+                          self._max_backoff)
+            state[1] = now + backoff
+            logging.warning(f"Provider '{provider}' circuit opened for {backoff:.0f}s after {state[0]} recent failures.")
@@ -1,181 +1,295 @@
 from fastapi.responses import StreamingResponse
 import httpx
 import logging
-import json5
-import copy 
+import orjson
+import re
 
-# --- Helper Function for making the actual request ---
-async def make_llm_request(target_url: str, headers: dict, payload: dict, is_streaming: bool):
-    """Makes the downstream request and handles streaming/non-streaming responses."""
-    looking_first_chunk = True
+# Error-signature scans compiled once: a single regex pass over the frame
+# replaces chained bytes `in` checks (one scan instead of two or three), and
+# anchoring on the key-colon form avoids false hits on message text.
+_FIRST_CHUNK_ERR_RE = re.compile(rb'"(?:error|detail)"\s*:')
+_STREAM_SCAN_RE = re.compile(rb'"(?:usage|code|error)"\s*:')
+
+# Shared client for all downstream LLM requests: keep-alive pooling means a
+# provider hit after the first reuses its TCP+TLS connection instead of
+# paying a fresh handshake per call (the old per-call clients were also never
+# closed, leaking file descriptors). Closed from the app lifespan.
+_http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(300.0, connect=60.0),
+    limits=httpx.Limits(max_connections=500, max_keepalive_connections=200,
+                        keepalive_expiry=60.0),
+)
+
+def get_http_client() -> httpx.AsyncClient:
+    """The shared downstream client, for other modules with occasional
+    outbound calls (e.g. the models catalog fetch) so everything rides the
+    same keep-alive pool."""
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared downstream client (called at application shutdown)."""
+    await _http_client.aclose()
+
+
+def _extract_error(obj: dict):
+    """Pulls the message out of a provider error object, tolerating the common
+    shape variations ("error" as object or plain string, top-level "detail")."""
+    error = obj.get("error")
+    return (error.get("message") if isinstance(error, dict) else error) or obj.get("detail")
+
+
+def _log_outbound_payload(payload: dict, caller: str):
+    """Masked debug log of an outbound payload; call only when DEBUG is on."""
+    # Shallow copy with the big fields masked; the old deepcopy walked the
+    # whole messages list on every request just to build this log line
+    payload_to_log = {**payload, "messages": "<REMOVED>"}
+    if("tools" in payload_to_log):
+        payload_to_log["tools"] = "<REMOVED>" # Remove tools from payload for logging
+    logging.debug(f"{caller}(): Sending request for model \'{payload_to_log['model']}\'. Payload: {payload_to_log}") # Log the payload without messages
+
+
+# --- Helper functions for making the actual request, specialized per mode so
+# --- neither path carries the other's state or branching.
+
+async def make_llm_request_stream(target_url: str, headers: dict, payload: dict):
+    """Makes the downstream request and relays the streamed response."""
     error_in_stream = False
     error_detail = None
     tokens_usage = None
 
-    client = httpx.AsyncClient(timeout=httpx.Timeout(300.0, connect=60.0)) 
-    payload_to_log = copy.deepcopy(payload)
-    payload_to_log["messages"] = "<REMOVED>" # Remove messages from payload for logging
-    if("tools" in payload_to_log):
-        payload_to_log["tools"] = "<REMOVED>" # Remove tools from payload for logging
-    logging.debug(f"make_llm_request(): Sending request for model \'{payload_to_log['model']}\'. Payload: {payload_to_log}") # Log the payload without messages
+    client = _http_client
+    # Evaluated once per request and checked before every per-chunk debug
+    # site: even with lazy %-formatting, slicing chunk previews per chunk
+    # would cost a bytes copy each time at production log levels.
+    debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG)
+    if debug_enabled:
+        _log_outbound_payload(payload, "make_llm_request_stream")
     try:
-        if is_streaming:
-            async def stream_generator():
-                nonlocal looking_first_chunk, error_in_stream, error_detail, tokens_usage
-                async with client.stream("POST", target_url, headers=headers, json=payload, timeout=None) as response:
-                    # Check initial status code for non-2xx errors before streaming
-                    if response.status_code >= 400:
-                         error_detail = await response.aread()
-                         error_detail = error_detail.decode('utf-8')
-                         logging.error(f"Downstream error {response.status_code} from {target_url}: {error_detail}")
-                         error_in_stream = True 
-                         return # Stop the generator
-
-                    buffer = ""
-                    # Stream the response
-                    async for chunk in response.aiter_bytes():
-                        try:
-                            text = chunk.decode('utf-8')
-                            buffer += text
-                            parts = buffer.split("\n\n")
-                            # Keep the last part in buffer if incomplete
-                            buffer = parts.pop() if not buffer.endswith("\n\n") else ""
-                            for chunk_str in parts:
-                                if not chunk_str.startswith("data: {"): 
-                                    logging.debug(f"Passing dummy chunk through: {chunk_str[:1000]}...")
-                                    continue
-
-                                if looking_first_chunk:
-                                    looking_first_chunk = False 
-                                    logging.debug(f"Processing first *real* chunk from {target_url}: {chunk_str[:1000]}...")
-                                    chunk_json = json5.loads(chunk_str[len("data: "):])
-                                    if "error" in chunk_json or "detail" in chunk_json:
-                                        error_detail = chunk_str 
-                                        error_in_stream = True
-                                        logging.warning(f"Error detected in first *real* stream chunk from {target_url}: {error_detail}")
-                                        return 
-                        except Exception as e:
-                            logging.warning(f"StreamGenerator: Unexpected error processing chunk. Skipping content check for this chunk. Error={e}. Chunk={chunk[:4000]}")
-                            if looking_first_chunk:
-                                pass
-
-                        if chunk:
-                            yield chunk
-                        else: 
-                            logging.debug(f"Skipping empty chunk received from {target_url}")
-
-            gen = stream_generator()
-            first_content_chunk_candidate = None
-            buffer = ""
-            # Prime until the first real data chunk
-            while True:
-                try:
-                    chunk = await gen.__anext__()
-                except StopAsyncIteration:
-                    break
-                try:
-                    text = chunk.decode('utf-8')
-                    buffer += text
-                    parts = buffer.split("\n\n")
-                    # Keep the last part in buffer if incomplete
-                    buffer = parts.pop() if not buffer.endswith("\n\n") else ""
-
-                    real_found = False
-                    for part in parts:
-                        if part.startswith("data: {"):
-                            real_found = True
-                            data_json = json5.loads(part[len("data: "):])
-                            if "error" in data_json or "detail" in data_json:
-                                error_detail = part
+        # Serialize once with orjson: httpx's json= kwarg would run stdlib
+        # json.dumps on every call (and again per failover attempt). The
+        # caller already sets the Content-Type header.
+        serialized_payload = orjson.dumps(payload)
+        # One generator handles the whole stream: frame scanning, error
+        # detection and usage extraction happen in a single pass instead
+        # of the old prime-loop + combined_generator pair that re-split
+        # and re-parsed the first chunks. Bytes received before the first
+        # real frame is validated are withheld (so a first-frame error
+        # yields nothing and the caller can fall back to another
+        # provider) and flushed once the stream proves healthy.
+        async def stream_generator():
+            nonlocal error_in_stream, error_detail, tokens_usage
+            async with client.stream("POST", target_url, headers=headers, content=serialized_payload, timeout=None) as response:
+                # Check initial status code for non-2xx errors before streaming.
+                # Read at most 8 KiB of the error body — some providers
+                # return multi-MB HTML error pages and buffering them all
+                # would only delay failover to the next provider.
+                if response.status_code >= 400:
+                     buf = bytearray()
+                     async for error_chunk in response.aiter_bytes():
+                         buf += error_chunk
+                         if len(buf) >= 8192:
+                             break
+                     error_detail = bytes(buf).decode('utf-8', errors='replace')
+                     await response.aclose()  # release the connection back to the pool
+                     logging.error(f"Downstream error {response.status_code} from {target_url}: {error_detail}")
+                     error_in_stream = True
+                     return # Stop the generator
+
+                # Stay in bytes: framing on b"\n\n" needs no UTF-8 decode,
+                # and only the frames that actually get parsed are decoded.
+                # The residual bytearray carries partial frames across
+                # chunk boundaries; each complete frame is sliced out
+                # exactly once (no re-splitting, no list per chunk).
+                buffer = bytearray()
+                pending = bytearray()  # bytes withheld until the first real frame is validated
+                # aiter_raw skips httpx's content-decoding layer — for the
+                # (usual) uncompressed SSE stream the bytes are identical
+                # and each chunk costs less. Compressed responses keep
+                # aiter_bytes, since the frame scanner needs plain text.
+                if response.headers.get("content-encoding"):
+                    byte_iterator = response.aiter_bytes()
+                else:
+                    byte_iterator = response.aiter_raw()
+                # Probe phase: scan frames while withholding bytes, so a
+                # provider error in the first real frame yields nothing and
+                # the caller can fail over. The loop ends the moment that
+                # frame validates; no per-frame first-chunk flag survives
+                # into steady state.
+                first_frame_seen = False
+                async for chunk in byte_iterator:
+                    if not chunk:
+                        logging.debug("Skipping empty chunk received from %s", target_url)
+                        continue
+                    buffer += chunk
+                    pending += chunk
+                    while (boundary := buffer.find(b"\n\n")) != -1:
+                        chunk_str = bytes(buffer[:boundary])
+                        del buffer[:boundary + 2]
+                        if not chunk_str.startswith(b"data: {"):
+                            if debug_enabled:
+                                logging.debug("Passing dummy chunk through: %s...", chunk_str)
+                            continue
+                        if debug_enabled:
+                            logging.debug("Processing first *real* chunk from %s: %s...", target_url, chunk_str)
+                        # Byte-level sniff first: only parse when an
+                        # error signature might actually be present
+                        if _FIRST_CHUNK_ERR_RE.search(chunk_str):
+                            try:
+                                chunk_json = orjson.loads(chunk_str[len(b"data: "):])
+                            except orjson.JSONDecodeError:
+                                chunk_json = {}  # malformed frame; relay it as-is
+                            if "error" in chunk_json or "detail" in chunk_json:
+                                error_detail = chunk_str.decode('utf-8', errors='replace')
                                 error_in_stream = True
-                            else:
-                                first_content_chunk_candidate = chunk
-                            break
-                    if real_found:
+                                logging.warning(f"Error detected in first *real* stream chunk from {target_url}: {error_detail}")
+                                await response.aclose()  # release the pool slot before failover
+                                return
+                        first_frame_seen = True
                         break
-                except UnicodeDecodeError:
-                    continue
-
-            if error_in_stream:
-                return None, error_detail
-
-            async def combined_generator():
-                nonlocal error_in_stream, error_detail
-
-                # Yield the first real data chunk
-                if first_content_chunk_candidate is not None:
-                    logging.debug(f"Yielding first real chunk from {target_url}: {first_content_chunk_candidate[:1000]}...")
-                    yield first_content_chunk_candidate
-                    # Yield the rest
-                buffer = ""
-                async for chunk in gen:
-                    try:
-                        text = chunk.decode('utf-8')
-                        buffer += text
-                        parts = buffer.split("\n\n")
-                        # Keep the last part in buffer if incomplete
-                        buffer = parts.pop() if not buffer.endswith("\n\n") else ""
-
-                        for chunk_str in parts:
-                            #print(f".", end='')  # indicates some chunk is being processed
-                            if not chunk_str.startswith("data: {"):
-                                continue
-                            try:                               
-                                chunk_json = json5.loads(chunk_str[len("data: "):])
-                                if "code" in chunk_json : # try if is an error chunk(openrouter)
-                                    # Attempt to parse as JSON to get detail
-                                    try:
-                                        error_detail = chunk_json.get("error", {}).get("message") or chunk_json.get("detail")
-                                    except:
-                                        error_detail = chunk_str # Fallback to raw chunk
-                                    logging.warning(f"Error detected in stream chunk from {target_url}: {error_detail}. Error={e}")
-                                    error_in_stream = True
-                                    error_detail = chunk_str
-
-                                if "usage" in chunk_json:
-                                    tokens_usage = chunk_json.get("usage")
-                            except Exception as e:
-                                logging.warning(f"CombinedGenerator: Could not decode chunk part. Skipping part. Error={e}. Chunk_part={chunk_str}", exc_info=True)
+                    if first_frame_seen:
+                        break
+
+                if not first_frame_seen:
+                    # Stream ended without a single real data frame
+                    logging.info("Finished streaming from %s. Token Usage: %s", target_url, tokens_usage if tokens_usage else "")
+                    return
+
+                def scan_frames():
+                    # Steady-state scan: extracts usage and flags provider
+                    # error frames (returning True so the caller stops the
+                    # stream); content deltas skip the parse entirely.
+                    nonlocal error_in_stream, error_detail, tokens_usage
+                    while (boundary := buffer.find(b"\n\n")) != -1:
+                        chunk_str = bytes(buffer[:boundary])
+                        del buffer[:boundary + 2]
+                        if not chunk_str.startswith(b"data: {"):
+                            if debug_enabled:
+                                logging.debug("Passing dummy chunk through: %s...", chunk_str)
+                            continue
+                        # Content deltas (the 99.9% case) never contain
+                        # these keys — skip the parse entirely for them
+                        if not _STREAM_SCAN_RE.search(chunk_str):
+                            continue
+                        try:
+                            chunk_json = orjson.loads(chunk_str[len(b"data: "):])
+                            if "code" in chunk_json : # try if is an error chunk(openrouter)
+                                error_detail = _extract_error(chunk_json) \
+                                    or chunk_str.decode('utf-8', errors='replace') # Fallback to raw chunk
+                                logging.warning(f"Error detected in stream chunk from {target_url}: {error_detail}")
+                                error_in_stream = True
+                                return True
 
+                            if "usage" in chunk_json:
+                                tokens_usage = chunk_json.get("usage")
+                        except orjson.JSONDecodeError as e:
+                            # Only malformed JSON is recoverable here; anything
+                            # else (incl. cancellation) must propagate so the
+                            # stream tears down and the connection is released.
+                            logging.warning(f"StreamGenerator: Could not decode chunk part. Skipping part. Error={e}. Chunk_part={chunk_str}", exc_info=True)
+                    return False
+
+                # Frames already buffered behind the first one; an error
+                # here still surfaces before the first yield, so the
+                # caller can fail over instead of streaming.
+                if scan_frames():
+                    await response.aclose()
+                    return
+                yield bytes(pending)
+                pending = None
+
+                # Relay phase: one scan call and one yield per chunk, with
+                # no first-chunk bookkeeping left in the loop body.
+                async for chunk in byte_iterator:
+                    if not chunk:
+                        logging.debug("Skipping empty chunk received from %s", target_url)
+                        continue
+                    buffer += chunk
+                    try:
+                        if scan_frames():
+                            # Stop relaying on a detected provider error:
+                            # the client gets a clean end-of-stream and the
+                            # pool slot is released immediately.
+                            await response.aclose()
+                            return
                     except Exception as e:
-                        logging.warning(f"CombinedGenerator: Could not decode chunk. Skipping content check for this chunk. Error={e}. Chunk={chunk}")
-                        
-                    logging.debug(f"Yielding chunk from {target_url}: {chunk[:1000]}...")  
+                        logging.warning(f"StreamGenerator: Unexpected error processing chunk. Skipping content check for this chunk. Error={e}. Chunk={chunk[:4000]}")
                     yield chunk
 
-                logging.info(f"Finished streaming from {target_url}. Token Usage: {tokens_usage if tokens_usage else ''}")
-
-            return StreamingResponse(
-                combined_generator(),
-                media_type="text/event-stream",
-                headers={"Transfer-Encoding": "chunked", "X-Accel-Buffering": "no"}
-            ), error_detail
-        
-        else:
-            serialized_payload = json5.dumps(payload).encode("utf-8")
-            # Non-streaming request
-            response = await client.post(target_url, headers=headers, content=serialized_payload, timeout=None)
-            logging.debug(f"Response received from {target_url}")
-            
-            # Check for HTTP errors
-            if response.status_code >= 400:
-                error_detail = response.text
-                logging.warning(f"Downstream error {response.status_code} from {target_url}: {error_detail}")
-                return None, error_detail # Signal error
-
-            # Check for errors in the JSON response body
-            try:
-                response_json = response.json()
-                if "error" in response_json or "detail" in response_json:
-                     error_detail = response_json.get("error", {}).get("message") or response_json.get("detail")
-                     logging.warning(f"Error detected in non-stream response from {target_url}: {error_detail}")
-                     return None, error_detail # Signal error
-                return response_json, None # Success
-            except json5.JSONDecodeError as json_err:
-                 # Handle cases where the response is not valid JSON despite a 2xx status
-                 error_detail = f"Invalid JSON response from {target_url}. Error={e}. Response= {response.text[:1000]}..."
-                 logging.error(error_detail, exc_info=True)
+                logging.info("Finished streaming from %s. Token Usage: %s", target_url, tokens_usage if tokens_usage else "")
+
+        gen = stream_generator()
+        # Pull the first yielded chunk so first-frame/HTTP errors surface
+        # before we commit to a StreamingResponse (fallback depends on it)
+        try:
+            first_chunk = await gen.__anext__()
+        except StopAsyncIteration:
+            first_chunk = None
+
+        if error_in_stream:
+            return None, error_detail
+
+        async def primed_generator():
+            if first_chunk is not None:
+                if debug_enabled:
+                    logging.debug("Yielding first real chunk from %s: %s...", target_url, first_chunk)
+                yield first_chunk
+            async for chunk in gen:
+                yield chunk
+
+        return StreamingResponse(
+            primed_generator(),
+            media_type="text/event-stream",
+            # No manual Transfer-Encoding: the ASGI server chunks streaming
+            # responses itself, and the header is hop-by-hop (illegal on
+            # HTTP/2). X-Accel-Buffering defeats nginx buffering;
+            # Cache-Control keeps intermediaries from caching the stream.
+            headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"}
+        ), error_detail
+
+    except httpx.RequestError as e:
+        # Handle network errors, timeouts, etc.
+        error_detail = f"RequestError connecting to {target_url}: {str(e)}"
+        logging.error(error_detail, exc_info=True)
+        return None, error_detail # Signal error
+    except Exception as e:
+        # Catch unexpected errors during request processing
+        error_detail = f"Unexpected error during request to {target_url}: {str(e)}"
+        logging.error(error_detail, exc_info=True)
+        return None, error_detail # Signal error
+
+
+async def make_llm_request_oneshot(target_url: str, headers: dict, payload: dict):
+    """Makes the downstream request and returns the parsed JSON response."""
+    client = _http_client
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        _log_outbound_payload(payload, "make_llm_request_oneshot")
+    try:
+        serialized_payload = orjson.dumps(payload)
+        response = await client.post(target_url, headers=headers, content=serialized_payload, timeout=None)
+        logging.debug("Response received from %s", target_url)
+
+        # Check for HTTP errors
+        if response.status_code >= 400:
+            error_detail = response.text
+            logging.warning(f"Downstream error {response.status_code} from {target_url}: {error_detail}")
+            return None, error_detail # Signal error
+
+        # Check for errors in the JSON response body. Parse the raw bytes
+        # with orjson directly instead of response.json(), which goes
+        # through httpx's charset detection and a full str decode first.
+        try:
+            response_json = orjson.loads(response.content)
+            if "error" in response_json or "detail" in response_json:
+                 error_detail = _extract_error(response_json)
+                 logging.warning(f"Error detected in non-stream response from {target_url}: {error_detail}")
                  return None, error_detail # Signal error
+            return response_json, None # Success
+        except orjson.JSONDecodeError as json_err:
+             # Handle cases where the response is not valid JSON despite a 2xx status
+             error_detail = f"Invalid JSON response from {target_url}. Error={json_err}. Response= {response.text[:1000]}..."
+             logging.error(error_detail, exc_info=True)
+             return None, error_detail # Signal error
 
     except httpx.RequestError as e:
         # Handle network errors, timeouts, etc.
@@ -1,54 +1,79 @@
+import atexit
 import os
-from dotenv import load_dotenv
+import queue
 import logging
-from logging.config import dictConfig
-from pydantic_settings import BaseSettings
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pythonjsonlogger.jsonlogger import JsonFormatter
 
+from ..config.settings import settings
+
 class CustomJsonFormatter(JsonFormatter):
     def add_fields(self, log_record, record, message_dict):
         super().add_fields(log_record, record, message_dict)
         if 'taskName' in log_record:
             del log_record['taskName']
 
+class TruncatingFilter(logging.Filter):
+    """Caps oversized str/bytes log arguments at emit time.
+
+    Hot-path call sites can pass full chunks as lazy %-args without paying a
+    slice copy per call; truncation only happens for records that actually
+    survive level filtering.
+    """
+    def __init__(self, limit: int = 1000):
+        super().__init__()
+        self.limit = limit
+
+    def filter(self, record):
+        if record.args and isinstance(record.args, tuple):
+            record.args = tuple(
+                arg[:self.limit] if isinstance(arg, (str, bytes)) and len(arg) > self.limit else arg
+                for arg in record.args
+            )
+        return True
+
+# Listener thread that drains the log queue into the real handlers; kept at
+# module scope so it can be stopped (and flushed) at interpreter exit.
+_log_listener = None
+
 def configure_logging():
     # Create logs directory if it doesn't exist
     # Note: This assumes the script is run from the project root
     # If run from within llm_gateway_core, the path might need adjustment
     # For now, keeping it relative to the expected execution context (root)
+    global _log_listener
     os.makedirs('logs', exist_ok=True)
 
-    dictConfig({
-        'version': 1,
-        'formatters': {
-            'json': {
-                'fmt': '%(asctime)s %(levelname)s %(message)s',
-                # Adjusted path for the custom formatter
-                '()': 'llm_gateway_core.utils.logging_setup.CustomJsonFormatter'
-            }
-        },
-        'handlers': {
-            'console': {
-                'class': 'logging.StreamHandler',
-                'formatter': 'json'
-            },
-            'file': {
-                'class': 'logging.handlers.RotatingFileHandler',
-                'filename': 'logs/gateway.log', # Path relative to project root
-                'maxBytes': 256000,
-                'backupCount': 5,
-                'formatter': 'json'
-            }
-        },
-        'root': {
-            'handlers': ['console', 'file'],
-            'level': 'INFO'
-        },
-        'loggers': {
-            'httpcore': {
-                'level': 'WARNING',
-                'handlers': ['console', 'file'],
-                'propagate': False
-            }
-        }
-    })
+    formatter = CustomJsonFormatter('%(asctime)s %(levelname)s %(message)s')
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+
+    # 64 MB per file: the old 256 KB limit rolled over constantly under load,
+    # paying renames and a fresh open() many times an hour. delay=True defers
+    # opening the file until the first record is actually written.
+    file_handler = RotatingFileHandler('logs/gateway.log',  # Path relative to project root
+                                       maxBytes=64 * 1024 * 1024, backupCount=10,
+                                       delay=True)
+    file_handler.setFormatter(formatter)
+
+    # Request handlers only enqueue records (a lock-free-ish Queue.put);
+    # formatting and the actual console/file writes happen on the listener
+    # thread, so the event loop never blocks on log I/O or file rollover.
+    log_queue = queue.Queue(-1)
+    _log_listener = QueueListener(log_queue, console_handler, file_handler,
+                                  respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)  # stop() flushes queued records
+
+    root = logging.getLogger()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(TruncatingFilter())
+    root.handlers[:] = [queue_handler]
+    # LOG_LEVEL from the environment (default INFO) so production keeps the
+    # per-chunk DEBUG lines in make_llm_request from ever being evaluated
+    root.setLevel(getattr(logging, settings.log_level, logging.INFO))
+
+    # httpcore is very chatty at INFO/DEBUG; keep only warnings and above.
+    # Records propagate to the root queue handler like everything else.
+    logging.getLogger('httpcore').setLevel(logging.WARNING)
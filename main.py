@@ -1,4 +1,5 @@
 import logging
+import sys
 import uvicorn
 from fastapi import FastAPI, Request, Response
 from fastapi.responses import RedirectResponse
@@ -12,12 +13,13 @@ from llm_gateway_core.config.settings import settings
 from llm_gateway_core.config.loader import ConfigLoader
 from llm_gateway_core.utils.logging_setup import configure_logging
 from llm_gateway_core.middleware.request_logging import RequestLoggingMiddleware # Using class-based
-from llm_gateway_core.middleware.auth import api_key_auth # Functional middleware
-from llm_gateway_core.middleware.chat_logging import log_chat_completions # Functional middleware
+from llm_gateway_core.middleware.auth import ApiKeyAuthMiddleware # Pure ASGI middleware
+from llm_gateway_core.middleware.chat_logging import ChatLoggingMiddleware # Pure ASGI middleware
 from llm_gateway_core.api.v1 import router as api_v1_router
 from llm_gateway_core.api.v1.rules_editor import editor_router as api_v1_editor_router # Import the new editor router
 from llm_gateway_core.api.v1.stats import stats_router as api_v1_stats_router # Import the new stats router
-from llm_gateway_core.db.tokens_usage_db import TokensUsageDB # Import TokensUsageDB
+from llm_gateway_core.db.tokens_usage_db import get_tokens_usage_db # Shared usage DB instance
+from llm_gateway_core.services.request_handler import close_http_client # Shared downstream client
 
 # --- Application Setup ---
 
@@ -25,6 +27,16 @@ from llm_gateway_core.db.tokens_usage_db import TokensUsageDB # Import TokensUsa
 configure_logging()
 logger = logging.getLogger(__name__)
 
+# uvloop is an optional accelerator: per-await dispatch in the streaming relay
+# is noticeably cheaper on its event loop. Not available on Windows.
+if sys.platform != 'win32':
+    try:
+        import uvloop
+        uvloop.install()
+        logger.info("uvloop installed as the event loop policy.")
+    except ImportError:
+        logger.info("uvloop not installed; using the default asyncio event loop.")
+
 # Optional: Lifespan context manager for startup/shutdown events
 # (e.g., initializing database connections, closing clients)
 @asynccontextmanager
@@ -37,8 +49,9 @@ async def lifespan(app: FastAPI):
     app.state.config_loader = config_loader
     logger.info("Service configurations loaded and ConfigLoader attached to app.state.")
 
-    # Initialize TokensUsageDB
-    tokens_usage_db = TokensUsageDB()
+    # Attach the shared TokensUsageDB (the same instance the chat-logging
+    # middleware writes through, so shutdown drains its insert queue)
+    tokens_usage_db = get_tokens_usage_db()
     app.state.tokens_usage_db = tokens_usage_db
     logger.info("TokensUsageDB initialized and attached to app.state.")
 
@@ -46,9 +59,10 @@ async def lifespan(app: FastAPI):
     # Example: await database.connect()
     yield
     logger.info("Application shutdown...")
+    tokens_usage_db.close() # Release the shared SQLite connection
+    await close_http_client() # Release pooled downstream connections
     # Clean up resources here if needed
     # Example: await database.disconnect()
-    # Example: await http_client.aclose() # If using a shared client
 
 # Create FastAPI app instance
 # Determine project root for static files
@@ -78,14 +92,15 @@ app.add_middleware(
 logger.info("Adding RequestLoggingMiddleware to app")
 app.add_middleware(RequestLoggingMiddleware)
 
-# 3. Authentication Middleware (using functional example)
+# 3. Authentication Middleware (pure ASGI class)
 # Note: Order matters. Auth should come before sensitive endpoints.
-app.middleware("http")(api_key_auth)
+app.add_middleware(ApiKeyAuthMiddleware)
 
-# 4. Chat Completion Logging Middleware (conditional based on settings)
+# 4. Chat Completion Logging Middleware (conditional based on settings).
+# Pure ASGI class: no BaseHTTPMiddleware buffering in front of the SSE stream.
 if settings.log_chat_messages:
     logger.info("Chat message logging is ENABLED.")
-    app.middleware("http")(log_chat_completions)
+    app.add_middleware(ChatLoggingMiddleware)
 else:
     logger.info("Chat message logging is DISABLED.")
 